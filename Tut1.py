@@ -1,4 +1,5 @@
 # Tutorial 1 : Basics, Path and Query Parameters
+import bisect
 from fastapi import FastAPI,Path,Query
 from typing import Optional
 app=FastAPI()
@@ -14,6 +15,45 @@ Blogs={
 
    }
 }
+
+# Lookup indexes, kept next to the data they index so that a lookup never scans it
+class NameIndex:
+    """Ids by case-insensitive name: a dict for exact lookups in O(1) and a sorted list
+    of (name, id) pairs for prefix lookups in O(log n) plus the matches returned."""
+
+    def __init__(self):
+        self.exact = {}  # casefolded name -> ids
+        self._sorted = []  # (casefolded name, id)
+
+    def add(self, name, item_id):
+        key = name.casefold()
+        self.exact.setdefault(key, []).append(item_id)
+        bisect.insort(self._sorted, (key, item_id))
+
+    def lookup(self, name):
+        return self.exact.get(name.casefold(), [])
+
+    def prefix(self, prefix, skip=0, limit=None):
+        """Ids whose name starts with prefix, in name order, skip and limit applied."""
+        key = prefix.casefold()
+        lo = bisect.bisect_left(self._sorted, (key,))
+        hi = bisect.bisect_left(self._sorted, (key + "\U0010ffff",), lo)
+        start = lo + skip
+        stop = hi if limit is None else min(hi, start + limit)
+        return [item_id for _, item_id in self._sorted[start:stop]]
+
+blog_names = NameIndex()
+blog_authors = NameIndex()
+
+# Blogs are only ever added, through add_blog so the indexes stay in step with them
+def add_blog(blog_id, blog):
+    Blogs[blog_id] = blog
+    blog_names.add(blog["name"], blog_id)
+    blog_authors.add(blog["author"], blog_id)
+
+for blog_id, blog in list(Blogs.items()):
+    add_blog(blog_id, blog)
+
 @app.get('/')
 def index():
    return {"data":"This the Home Page"}
@@ -67,10 +107,17 @@ def get_blog(blog_id:int=Path(description="Blog you requested",gt=0)):
 # query parameters can be optional and can have optional values
 # in the below example both skip and and limit have default values of 0 and 10 respectively
 fake_items_db = [{"item_name": "Foo"}, {"item_name": "Bar"}, {"item_name": "Baz"}]
+item_names = NameIndex()
+for position, item in enumerate(fake_items_db):
+    item_names.add(item["item_name"], position)
 
 
+# skip and limit are bounded, and name_prefix filters through the sorted name index,
+# so a page costs O(log n + limit) however many items there are
 @app.get("/db-items/")
-def read_item(skip: int = 0, limit: int = 10):
+def read_item(skip: int = Query(0, ge=0), limit: int = Query(10, ge=1, le=100), name_prefix: Optional[str] = None):
+    if name_prefix:
+        return [fake_items_db[position] for position in item_names.prefix(name_prefix, skip, limit)]
     return fake_items_db[skip : skip + limit]
 # http://127.0.0.1:8000/db-items/ is same as http://127.0.0.1:8000/items/?skip=0&limit=10
 # similary http://127.0.0.1:8000/db-items/?skip=0&limit=2, gives [{"item_name":"Foo"},{"item_name":"Bar"}]
@@ -121,15 +168,35 @@ def read_user_item(
 #     return item
 # ------------------------------------------------------
 # Returning Something from our Blog Dictionary
+# The name index finds the candidates, so no request walks every blog
 @app.get('/get-by-name/{blog_id}')
-def get_by_name(blog_id:int,name:str):
-    for blog_id in Blogs:
-        if Blogs[blog_id]["name"]==name:
+def get_by_name(blog_id:int,name:str,ignore_case:bool=False):
+    for blog_id in blog_names.lookup(name):
+        if ignore_case or Blogs[blog_id]["name"]==name:
             return Blogs[blog_id]
     return {"Data":"Blog not Found"}
 # http://127.0.0.1:8000/get-by-name/1?name=8 Skills to Master in NLP
 # {"name":"8 Skills to Master in NLP","author":"Hamza Jafri"}
 
+# Blogs of an author and/or starting with a name prefix, case-insensitive, from the indexes
+# http://127.0.0.1:8000/find-blogs/?author=hamza jafri&name_prefix=8 skills
+@app.get('/find-blogs/')
+def find_blogs(
+    author:Optional[str]=None,
+    name_prefix:Optional[str]=None,
+    skip:int=Query(0, ge=0),
+    limit:int=Query(10, ge=1, le=100),
+):
+    if author is not None:
+        ids = blog_authors.lookup(author)
+        if name_prefix:
+            prefix = name_prefix.casefold()
+            ids = [blog_id for blog_id in ids if Blogs[blog_id]["name"].casefold().startswith(prefix)]
+        ids = ids[skip : skip + limit]
+    else:
+        ids = blog_names.prefix(name_prefix or "", skip, limit)
+    return [{"blog_id": blog_id, **Blogs[blog_id]} for blog_id in ids]
+
 
    
    
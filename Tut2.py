@@ -1,9 +1,181 @@
 # Tutorial # 2 : Request Body and CRUD Operations
-from fastapi import FastAPI,status,HTTPException
+import bisect
+import json
+import os
+import threading
+from array import array
+from itertools import islice
+from contextlib import asynccontextmanager
+from fastapi import FastAPI,status,HTTPException,Query
 from typing import Optional
 from pydantic import BaseModel
 
-app=FastAPI()
+# Set TUT2_ITEMS_FILE (e.g. items.json) to save the items every TUT2_ITEMS_SAVE_SECONDS
+# and on shutdown, and to load them back at startup. Unset, they live in memory only.
+ITEMS_FILE = os.getenv("TUT2_ITEMS_FILE")
+ITEMS_SAVE_SECONDS = float(os.getenv("TUT2_ITEMS_SAVE_SECONDS", "5"))
+
+class ItemRecord:
+    # __slots__ keeps a record small (no per-instance __dict__), price_with_tax is computed
+    # once when the item is written instead of on every GET
+    __slots__ = ("item_id", "name", "description", "price", "tax", "price_with_tax")
+
+    def __init__(self, item_id, name, description, price, tax):
+        self.item_id = item_id
+        self.name = name
+        self.description = description
+        self.price = price
+        self.tax = tax
+        self.price_with_tax = price + (tax or 0)
+
+    def to_dict(self):
+        return {"item_id": self.item_id, "name": self.name, "description": self.description,
+                "price": self.price, "tax": self.tax, "price_with_tax": self.price_with_tax}
+
+    def to_row(self):
+        return [self.item_id, self.name, self.description, self.price, self.tax]
+
+def _position(keys, ids, key, item_id):
+    # keys/ids are parallel lists sorted by (key, id): find the key's run, then the id within it
+    lo = bisect.bisect_left(keys, key)
+    hi = bisect.bisect_right(keys, key, lo)
+    return bisect.bisect_left(ids, item_id, lo, hi)
+
+class ItemSnapshot:
+    """An immutable version of the catalog: records by id plus sorted price and name
+    indexes. Readers grab store.snapshot once and never lock; every write builds a new
+    snapshot (copy-on-write), so a reader never sees a half applied change."""
+
+    __slots__ = ("by_id", "prices", "price_ids", "names", "name_ids", "version")
+
+    def __init__(self, by_id, prices, price_ids, names, name_ids, version):
+        self.by_id = by_id
+        self.prices = prices        # array of floats, ascending
+        self.price_ids = price_ids  # the item id of each price
+        self.names = names          # casefolded names, ascending
+        self.name_ids = name_ids
+        self.version = version
+
+    @classmethod
+    def build(cls, records, version=0):
+        by_id = {record.item_id: record for record in records}
+        by_price = sorted(by_id.values(), key=lambda r: (r.price, r.item_id))
+        by_name = sorted(by_id.values(), key=lambda r: (r.name.casefold(), r.item_id))
+        return cls(
+            by_id,
+            array("d", (r.price for r in by_price)), [r.item_id for r in by_price],
+            [r.name.casefold() for r in by_name], [r.item_id for r in by_name],
+            version,
+        )
+
+    def replace(self, old, new):
+        """A new snapshot with record old removed and record new added, either may be None."""
+        by_id = dict(self.by_id)
+        prices, price_ids = array("d", self.prices), list(self.price_ids)
+        names, name_ids = list(self.names), list(self.name_ids)
+        if old is not None:
+            del by_id[old.item_id]
+            i = _position(prices, price_ids, old.price, old.item_id)
+            del prices[i], price_ids[i]
+            i = _position(names, name_ids, old.name.casefold(), old.item_id)
+            del names[i], name_ids[i]
+        if new is not None:
+            by_id[new.item_id] = new
+            i = _position(prices, price_ids, new.price, new.item_id)
+            prices.insert(i, new.price)
+            price_ids.insert(i, new.item_id)
+            i = _position(names, name_ids, new.name.casefold(), new.item_id)
+            names.insert(i, new.name.casefold())
+            name_ids.insert(i, new.item_id)
+        return ItemSnapshot(by_id, prices, price_ids, names, name_ids, self.version + 1)
+
+    def by_price(self, min_price=None, max_price=None):
+        lo = 0 if min_price is None else bisect.bisect_left(self.prices, min_price)
+        hi = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, max_price)
+        return (self.by_id[self.price_ids[i]] for i in range(lo, hi))
+
+    def by_name_prefix(self, prefix):
+        key = prefix.casefold()
+        lo = bisect.bisect_left(self.names, key)
+        hi = bisect.bisect_left(self.names, key + "\U0010ffff", lo)
+        return (self.by_id[self.name_ids[i]] for i in range(lo, hi))
+
+class ItemStore:
+    """Thread-safe item catalog. Route handlers run on threadpool workers, so writes are
+    serialized by a lock, while reads only take the current snapshot."""
+
+    def __init__(self):
+        self.snapshot = ItemSnapshot.build([])
+        self._lock = threading.Lock()
+
+    def get(self, item_id):
+        return self.snapshot.by_id.get(item_id)
+
+    def create(self, item_id, item):
+        """The new record, None if item_id is taken."""
+        with self._lock:
+            if item_id in self.snapshot.by_id:
+                return None
+            record = ItemRecord(item_id, **item.dict())
+            self.snapshot = self.snapshot.replace(None, record)
+            return record
+
+    def update(self, item_id, item):
+        """The new record, None if there is no item_id."""
+        with self._lock:
+            old = self.snapshot.by_id.get(item_id)
+            if old is None:
+                return None
+            record = ItemRecord(item_id, **item.dict())
+            self.snapshot = self.snapshot.replace(old, record)
+            return record
+
+    def delete(self, item_id):
+        """The deleted record, None if there is no item_id."""
+        with self._lock:
+            old = self.snapshot.by_id.get(item_id)
+            if old is not None:
+                self.snapshot = self.snapshot.replace(old, None)
+            return old
+
+    def save(self, path):
+        """Writes the current snapshot to path atomically, returns the version saved."""
+        snapshot = self.snapshot
+        with open(f"{path}.tmp", "w") as f:
+            json.dump([record.to_row() for record in snapshot.by_id.values()], f, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+        return snapshot.version
+
+    def load(self, path):
+        with open(path) as f:
+            records = [ItemRecord(*row) for row in json.load(f)]
+        with self._lock:
+            self.snapshot = ItemSnapshot.build(records)
+
+items = ItemStore()  # In-memory storage for demonstration
+
+def save_periodically(stop):
+    saved = items.snapshot.version
+    while not stop.wait(ITEMS_SAVE_SECONDS):
+        if items.snapshot.version != saved:
+            saved = items.save(ITEMS_FILE)
+
+@asynccontextmanager
+async def lifespan(app):
+    if not ITEMS_FILE:
+        yield
+        return
+    if os.path.exists(ITEMS_FILE):
+        items.load(ITEMS_FILE)
+    stop = threading.Event()
+    saver = threading.Thread(target=save_periodically, args=(stop,), daemon=True)
+    saver.start()
+    yield
+    stop.set()
+    saver.join()
+    items.save(ITEMS_FILE)
+
+app=FastAPI(lifespan=lifespan)
 # When you need to send data from a client (let's say, a browser) to your API, you send it as a request body.
 #A request body is data sent by the client to your API. A response body is the data your API sends to the client.
 # Your API almost always has to send a response body. But clients don't necessarily need to send request bodies all the time, 
@@ -25,45 +197,53 @@ class Item(BaseModel):
 #         price_with_tax = item.price + item.tax
 #         item_dict.update({"price_with_tax": price_with_tax})
 #     return item_dict
-items = {}  # In-memory storage for demonstration
 # adding the item
 @app.post('/items/{item_id}')
 def create_item(item_id:int,item:Item):
-    if item_id in items:
+    record = items.create(item_id, item)
+    if record is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="item id  already exist")
-    items[item_id]=item
-    return{"item_id":item_id,**item.dict(),"price_with_tax": item.price + (item.tax or 0)}
+    return record.to_dict()
 
 # updating the item
 @app.put('/items/{item_id}')
 def update_item(item_id:int,item:Item):
-    if item_id not in items:
+    record = items.update(item_id, item)  # Update the existing item
+    if record is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="item name not found")
-    
-    items[item_id] = item  # Update the existing item
-    return {"item_id": item_id, **item.dict(),"price_with_tax": item.price + (item.tax or 0)}
+    return record.to_dict()
 
 # deleting an item
 @app.delete('/items/{item_id}')
 def delete_item(item_id:int,item:Item):
-    if item_id not in items:
+    deleted_item = items.delete(item_id)
+    if deleted_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="item  not found")
-    
-    # del items[item_id]
-    # return {"message": "Item deleted successfully"}
-    deleted_item = items.pop(item_id)
-    return {"message": "Item deleted successfully",**deleted_item.dict(), "price_with_tax": deleted_item.price + (deleted_item.tax or 0)}
+    return {"message": "Item deleted successfully",**deleted_item.to_dict()}
 
 # Get an Item
 @app.get('/items/{item_id}')
 def get_item(item_id:int):
-    if item_id not in items:
+    item=items.get(item_id)
+    if item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="item name not found")
-    
-    item=items[item_id]
-    return{"item_id":item_id,**item.dict(),"price_with_tax": item.price + (item.tax or 0)}
-
-
-
-    
+    return item.to_dict()
 
+# List Items in a price range, cheapest first, or by name prefix in name order when no
+# price bound is given. Both come from the sorted indexes, no item outside the range is visited.
+@app.get('/items')
+def list_items(
+    min_price:Optional[float]=None,
+    max_price:Optional[float]=None,
+    name_prefix:Optional[str]=None,
+    limit:int=Query(100, ge=1, le=1000),
+):
+    snapshot = items.snapshot  # one consistent version for the whole listing
+    if name_prefix and min_price is None and max_price is None:
+        matches = snapshot.by_name_prefix(name_prefix)
+    else:
+        matches = snapshot.by_price(min_price, max_price)
+        if name_prefix:
+            prefix = name_prefix.casefold()
+            matches = (record for record in matches if record.name.casefold().startswith(prefix))
+    return [record.to_dict() for record in islice(matches, limit)]
@@ -1,25 +1,51 @@
 # Tutorial # 3 : Database , User login, password hashing
-from fastapi import FastAPI,Depends,HTTPException,status
+from fastapi import FastAPI,Depends,HTTPException,status,Query,Request,Response
 from pydantic import BaseModel
-from sqlalchemy import create_engine,Column,String,Integer,Float,Boolean
+from sqlalchemy import Column,String,Integer,Float,Boolean,insert,select,func
 from sqlalchemy.orm import declarative_base,sessionmaker,Session
-from typing import Optional,List
+from Tut5_APIRouting.engines import create_sqlite_engine, READ_METHODS
+from Tut5_APIRouting.config import ANALYTICS_SNAPSHOT, DB_READ_POOL_SIZE, TUT3_DATABASE_URL
+from Tut5_APIRouting import versions, indexes, http_cache, ratelimit, tabular, compat, pagination
+from web_common import compression, metrics
+from typing import Optional,List,Literal
 # from passlib.context import CryptContext
 import bcrypt
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 import jwt
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 app=FastAPI()
 
-DATABASE_URL = "sqlite:///./places.db"  # SQLite database file
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-# Session for interacting with the database
+DATABASE_URL = TUT3_DATABASE_URL  # SQLite database file, places.db unless overridden
+# WAL mode, busy timeout and pool sizing come from the shared SQLite engine factory
+engine = create_sqlite_engine(DATABASE_URL)
+# Read-only engine for the GET routes, the streams and the export, so readers run
+# side by side instead of queueing on the write engine's BEGIN IMMEDIATE
+read_engine = create_sqlite_engine(DATABASE_URL, read_only=True, pool_size=DB_READ_POOL_SIZE)
+# Sessions for interacting with the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# gzip/brotli for JSON bodies above the size threshold
+compression.install(app)
+# Per-route latency, SQL statement counts and timings on /metrics
+metrics.install(app, engine, read_engine)
 Base = declarative_base()
 
-def get_db():
-    db=SessionLocal()
+# GET routes get a read-only session
+def get_db(request: Request):
+    db=ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Read-only session for the login lookup, which is a POST
+def get_read_db():
+    db=ReadSessionLocal()
     try:
         yield db
     finally:
@@ -59,6 +85,108 @@ def decode_access_token(token: str):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Verified token cache: a token presented again skips jwt.decode until its exp, or for
+# TOKEN_CACHE_TTL_SECONDS when a validly signed token carries no exp
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_CACHE_TTL_SECONDS = 300
+USER_CACHE_MAX_ENTRIES = 10000
+USER_CACHE_TTL_SECONDS = 60
+
+class TTLCache:
+    """Bounded LRU where every entry carries its own expiry time (epoch seconds)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class RevocationList:
+    """Digests of revoked tokens, each kept until its token expires. Nothing is evicted
+    before that, an evicted token would be accepted again, so when the list is full of
+    live entries add() refuses the new one instead.
+
+    The list lives in the process, like the caches above. Run with several workers
+    (python -m Tut5_APIRouting.serve), a logout only reaches the worker that served it
+    and the others keep accepting the token until it expires. Keep Tut3 to a single
+    worker, or move this list and verified_tokens to a store every worker shares."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = {}  # digest -> expires_at
+        self._lock = threading.Lock()
+
+    def is_revoked(self, digest) -> bool:
+        with self._lock:
+            expires_at = self._data.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._data[digest]
+                return False
+            return True
+
+    def add(self, digest, expires_at: float) -> bool:
+        with self._lock:
+            if digest not in self._data and len(self._data) >= self.max_entries:
+                now = time.time()
+                for key in [key for key, expiry in self._data.items() if expiry <= now]:
+                    del self._data[key]
+                if len(self._data) >= self.max_entries:
+                    return False
+            self._data[digest] = expires_at
+            return True
+
+verified_tokens = TTLCache(TOKEN_CACHE_MAX_ENTRIES)  # token digest -> payload
+revoked_tokens = RevocationList(TOKEN_CACHE_MAX_ENTRIES)
+cached_users = TTLCache(USER_CACHE_MAX_ENTRIES)      # email -> UserResponse
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+def verify_access_token(token: str) -> dict:
+    digest = token_digest(token)
+    if revoked_tokens.is_revoked(digest):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    payload = verified_tokens.get(digest)
+    if payload is None:
+        payload = decode_access_token(token)
+        verified_tokens.set(digest, payload, payload.get("exp") or time.time() + TOKEN_CACHE_TTL_SECONDS)
+    return payload
+
+def revoke_access_token(token: str):
+    payload = verify_access_token(token)
+    digest = token_digest(token)
+    # A token without exp never expires, so neither does its revocation
+    if not revoked_tokens.add(digest, payload.get("exp") or float("inf")):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many revoked tokens, try again later",
+            headers={"Retry-After": "60"},
+        )
+    verified_tokens.pop(digest)
+
 
 # A SQLAlchemny ORM Place
 class DBPlace(Base):
@@ -77,10 +205,15 @@ class DBUser(Base):
 
      id = Column(Integer, primary_key=True, index=True)
      name = Column(String(50))
-     email=Column(String,unique=True)
+     email=Column(String,unique=True,index=True)
      password=Column(String)   
 # Create tables
 Base.metadata.create_all(bind=engine)
+# Row and collection versions behind the place ETags (see Tut5_APIRouting/versions.py)
+with engine.begin() as connection:
+    versions.ensure(connection, "places")
+    # create_all skips existing tables, so an older places.db gets the newer indexes here
+    indexes.add_missing_indexes(connection, Base.metadata)
 
 # Pydantic models for request/response validation
 class Place(BaseModel):
@@ -108,9 +241,30 @@ class UserResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+# Dependency for authenticated endpoints: the token and the user record both come
+# from the caches above, so a repeat request does no crypto and no user query.
+# The read session is only opened on a user cache miss
+def get_current_user(token: str = Depends(oauth2_scheme)) -> UserResponse:
+    payload = verify_access_token(token)
+    email = payload.get("sub")
+    if not email:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user = cached_users.get(email)
+    if user is None:
+        with ReadSessionLocal() as db:
+            db_user = db.query(DBUser).filter(DBUser.email == email).first()
+        if not db_user:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = compat.from_orm(UserResponse, db_user)
+        cached_users.set(email, user, time.time() + USER_CACHE_TTL_SECONDS)
+    return user
 #--------------------------------------------
-@app.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+# Token logins are limited per client IP and per username before any lookup or bcrypt work
+token_limit = ratelimit.RateLimit("tut3_token", key_field="username")
+
+@app.post("/token", dependencies=[Depends(token_limit)])
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
     user = db.query(DBUser).filter(DBUser.email == form_data.username).first()
     if not user or not verify_password(form_data.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -119,9 +273,14 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     return {"access_token": token, "token_type": "bearer"}
 
 @app.get("/secure-endpoint", tags=["Secure"])
-def secure_endpoint(token: str = Depends(oauth2_scheme)):
-    payload = decode_access_token(token)
-    return {"message": f"Hello {payload['sub']}! You have accessed a secure endpoint."}
+def secure_endpoint(user: UserResponse = Depends(get_current_user)):
+    return {"message": f"Hello {user.email}! You have accessed a secure endpoint."}
+
+# Revoke the presented token, it is rejected from now until it would have expired
+@app.post("/logout", tags=["Secure"])
+def logout(token: str = Depends(oauth2_scheme)):
+    revoke_access_token(token)
+    return {"message": "Token revoked"}
 # -------------------------------------------
 # Endpoints
 # Routes for interacting with the API
@@ -135,20 +294,105 @@ def create_place(place:Place,db:Session=Depends(get_db)):
     db.refresh(db_place)
     return db_place
 
-# get place by id
+# get place by id, a client sending the ETag back in If-None-Match gets a 304
+# from the place's version alone while the place is unchanged
 @app.get('/get-place/{place_id}',response_model=Place,tags=["Places"])
-def get_place(place_id:int,db: Session = Depends(get_db)):
+def get_place(place_id:int,request: Request,response: Response,db: Session = Depends(get_db)):
+    version = versions.row_version(db, "places", place_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="place not found")
+    etag = http_cache.etag("place", place_id, version)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    http_cache.set_headers(response, etag)
+
     place=db.query(DBPlace).filter(DBPlace.id == place_id).first()
     if not place:
         raise HTTPException(status_code=404, detail="place not found")
     return place
 
-# get all places
+# get all places, a keyset page at a time: pass the X-Next-Cursor header back as ?cursor=
+# or use ?stream=true to get every place after the cursor as NDJSON (limit is ignored)
+# pages carry a collection ETag that every place write changes
 @app.get('/get-all-places',response_model=List[Place],tags=["Places"])
-def get_all_places(db: Session = Depends(get_db)):
-    places_all=db.query(DBPlace).all()
+def get_all_places(request: Request, response: Response, limit: int = Query(100, ge=1, le=1000), after_id: Optional[int] = None,
+                   cursor: Optional[str] = None, stream: bool = False, db: Session = Depends(get_db)):
+    after_id = pagination.resolve_after_id(after_id, cursor)
+    etag = http_cache.etag("places", versions.collection_version(db, "places"))
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    if stream:
+        streamed = pagination.ndjson_response(select(
+            DBPlace.id, DBPlace.name, DBPlace.description, DBPlace.coffee, DBPlace.wifi, DBPlace.food
+        ).where(DBPlace.id > after_id).order_by(DBPlace.id), ReadSessionLocal)
+        http_cache.set_headers(streamed, etag)
+        return streamed
+
+    http_cache.set_headers(response, etag)
+    places_all=db.query(DBPlace).filter(DBPlace.id > after_id).order_by(DBPlace.id).limit(limit).all()
+    if len(places_all) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(places_all[-1].id)
     return places_all
 
+# Export every place as CSV or Parquet (needs pyarrow), streamed from a server-side cursor
+# a batch at a time (see Tut5_APIRouting/tabular.py)
+@app.get('/export-places',tags=["Places"])
+def export_places(fmt: Literal["csv", "parquet"] = Query("csv", alias="format")):
+    stmt = select(DBPlace.id, DBPlace.name, DBPlace.description, DBPlace.coffee, DBPlace.wifi, DBPlace.food).order_by(DBPlace.id)
+    return tabular.export_response(ReadSessionLocal, stmt, fmt, "places")
+
+class PlaceImport(BaseModel):
+    name: str
+    description: Optional[str] = None
+    coffee: bool
+    wifi: bool
+    food: bool
+
+def insert_places(rows):
+    with SessionLocal() as db:
+        db.execute(insert(DBPlace), rows)
+        db.commit()
+    return []  # every validated place is accepted
+
+# Import places from a CSV or Parquet request body, an id column is ignored (places get new
+# ids); rows are parsed as they arrive and committed a batch at a time
+@app.post('/import-places',tags=["Places"])
+async def import_places(request: Request, fmt: Literal["csv", "parquet"] = Query("csv", alias="format")):
+    return await tabular.import_upload(request, fmt, "places", PlaceImport, insert_places)
+
+# How many places have each combination of amenities, from one GROUP BY query, or with
+# ANALYTICS_SNAPSHOT=1 from NumPy columns kept in memory (Tut5_APIRouting/columnar.py).
+# "matching" counts the places with the amenities asked for, e.g. ?wifi=true&coffee=true
+AMENITIES = ("coffee", "wifi", "food")
+if ANALYTICS_SNAPSHOT:
+    from Tut5_APIRouting import columnar
+    place_columns = columnar.ColumnarSnapshot("places", AMENITIES, ["bool"] * len(AMENITIES))
+
+@app.get('/place-amenity-counts',tags=["Places"])
+def place_amenity_counts(coffee: Optional[bool] = None, wifi: Optional[bool] = None, food: Optional[bool] = None,
+                         db: Session = Depends(get_db)):
+    combinations = {}
+    if ANALYTICS_SNAPSHOT:
+        columns = place_columns.refresh(db)
+        for code, count in enumerate(columnar.combination_counts(*(columns[name] for name in AMENITIES)).tolist()):
+            if count:
+                combinations[(bool(code & 4), bool(code & 2), bool(code & 1))] = count
+    else:
+        for place_coffee, place_wifi, place_food, count in db.query(
+            DBPlace.coffee, DBPlace.wifi, DBPlace.food, func.count(DBPlace.id)
+        ).group_by(DBPlace.coffee, DBPlace.wifi, DBPlace.food):
+            key = (bool(place_coffee), bool(place_wifi), bool(place_food))  # NULL counts as no
+            combinations[key] = combinations.get(key, 0) + count
+
+    wanted = (coffee, wifi, food)
+    return {
+        "total": sum(combinations.values()),
+        "with": {name: sum(n for key, n in combinations.items() if key[i]) for i, name in enumerate(AMENITIES)},
+        "matching": sum(n for key, n in combinations.items()
+                        if all(want is None or has == want for has, want in zip(key, wanted))),
+        "combinations": [{**dict(zip(AMENITIES, key)), "places": n} for key, n in sorted(combinations.items(), reverse=True)],
+    }
+
 # PUT - Update a place
 @app.put('/update-place/{place_id}', response_model=Place,tags=["Places"])
 def update_place(place_id: int, updated_place: Place, db: Session = Depends(get_db)):
@@ -1,22 +1,44 @@
 # Tutorial # 4 : Relationships Between the Tables
-from fastapi import FastAPI,Depends,HTTPException,status
+from fastapi import FastAPI,Depends,HTTPException,status,Query,Request,Response
 from pydantic import BaseModel
-from sqlalchemy import create_engine,Column,String,Integer,Float,Boolean
+from sqlalchemy import Column,String,Integer,Float,Boolean,select
 from sqlalchemy.orm import declarative_base,sessionmaker,Session
+from Tut5_APIRouting.engines import create_sqlite_engine, READ_METHODS
+from Tut5_APIRouting.config import DB_READ_POOL_SIZE, TUT4_DATABASE_URL
+from Tut5_APIRouting import ratelimit, pagination, indexes
+from web_common import compression, metrics
 from typing import Optional,List
 import bcrypt
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
 
 app=FastAPI()
-DATABASE_URL = "sqlite:///./Blogs.db"  # SQLite database file
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-# Session for interacting with the database
+DATABASE_URL = TUT4_DATABASE_URL  # SQLite database file, Blogs.db unless overridden
+# WAL mode, busy timeout and pool sizing come from the shared SQLite engine factory
+engine = create_sqlite_engine(DATABASE_URL)
+# Read-only engine for the GET routes and the stream, so readers run
+# side by side instead of queueing on the write engine's BEGIN IMMEDIATE
+read_engine = create_sqlite_engine(DATABASE_URL, read_only=True, pool_size=DB_READ_POOL_SIZE)
+# Sessions for interacting with the database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# gzip/brotli for JSON bodies above the size threshold
+compression.install(app)
+# Per-route latency, SQL statement counts and timings on /metrics
+metrics.install(app, engine, read_engine)
 Base = declarative_base()
 
-def get_db():
-    db=SessionLocal()
+# GET routes get a read-only session
+def get_db(request: Request):
+    db=ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Read-only session for the login lookup, which is a POST
+def get_read_db():
+    db=ReadSessionLocal()
     try:
         yield db
     finally:
@@ -30,7 +52,7 @@ class DBBlog(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50))
     description = Column(String, nullable=True)
-    author_id = Column(Integer, ForeignKey('authors.id'))  # ForeignKey to the authors table
+    author_id = Column(Integer, ForeignKey('authors.id'), index=True)  # ForeignKey to the authors table
 
     # Relationship to DBAuthor
     writer = relationship("DBAuthor", back_populates="writings")
@@ -42,7 +64,7 @@ class DBAuthor(Base):
 
      id = Column(Integer, primary_key=True, index=True)
      name = Column(String(50))
-     email=Column(String,unique=True)
+     email=Column(String,unique=True,index=True)
      password=Column(String)   
 
      # Relationship to DBBlog
@@ -50,6 +72,9 @@ class DBAuthor(Base):
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+# create_all skips existing tables, so an older Blogs.db gets the newer indexes here
+with engine.begin() as connection:
+    indexes.add_missing_indexes(connection, Base.metadata)
 
 # Pydantic models for request/response validation
 class Blogs(BaseModel):
@@ -108,10 +133,20 @@ def get_blog(blog_id:int,db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="blog not found")
     return blog
 
-# get all blogs
+# get all blogs, a keyset page at a time: pass the X-Next-Cursor header back as ?cursor=
+# or use ?stream=true to get every blog after the cursor as NDJSON (limit is ignored)
 @app.get('/get-all-blogs',response_model=List[Blogs],tags=["Blogs"])
-def get_all_blogs(db: Session = Depends(get_db)):
-    blogs_all=db.query(DBBlog).all()
+def get_all_blogs(response: Response, limit: int = Query(100, ge=1, le=1000), after_id: Optional[int] = None,
+                  cursor: Optional[str] = None, stream: bool = False, db: Session = Depends(get_db)):
+    after_id = pagination.resolve_after_id(after_id, cursor)
+    if stream:
+        return pagination.ndjson_response(select(
+            DBBlog.id, DBBlog.name, DBBlog.description, DBBlog.author_id
+        ).where(DBBlog.id > after_id).order_by(DBBlog.id), ReadSessionLocal)
+
+    blogs_all=db.query(DBBlog).filter(DBBlog.id > after_id).order_by(DBBlog.id).limit(limit).all()
+    if len(blogs_all) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(blogs_all[-1].id)
     return blogs_all
 
 # get blog created by specific user
@@ -181,9 +216,11 @@ def get_author(author_id:int,db:Session=Depends(get_db)):
         raise HTTPException(status_code=404, detail="place not found")
     return author
 
-# logging in the author
-@app.post('/login',tags=["login"])
-def login(email: str, password: str, db: Session = Depends(get_db)):
+# logging in the author, limited per client IP and per email before any lookup or bcrypt work
+login_limit = ratelimit.RateLimit("tut4_login")
+
+@app.post('/login',tags=["login"],dependencies=[Depends(login_limit)])
+def login(email: str, password: str, db: Session = Depends(get_read_db)):
     author = db.query(DBAuthor).filter(DBAuthor.email == email).first()
     if not author or not verify_password(password, author.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
@@ -0,0 +1,249 @@
+"""Load test and micro-benchmarks for the Tut5 API, with a JSON report.
+
+    python -m Tut5_APIRouting.benchmark --authors 200 --blogs 20000 --concurrency 32 \
+        --output bench.json [--compare baseline.json --max-regression 0.2]
+
+It seeds a scratch database (or the one given with --database-url, which has to be
+empty unless --force is passed, as seeding deletes every author and blog), drives
+every route of routers/blog.py and routers/author.py through an in-process ASGI
+client, times the hot functions directly and writes p50/p95/p99 latency and
+throughput per benchmark. With --compare, the run exits with status 1
+when any p95 is more than --max-regression slower than the baseline report.
+
+To compare the fast JSON path with response_model validation, run once as is and
+once with FAST_JSON=1 --compare the first report; the micro benchmarks time both
+serializers in every run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SEED_PASSWORD = "benchmark-password"
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed, errors=0):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def seed(authors, blogs, rng, force=False):
+    """Replaces the contents of the blogs and authors tables with synthetic rows. Refuses
+    to unless they are empty or force is set, so a real database is never wiped by accident."""
+    from sqlalchemy import delete, insert, select
+    from . import config, database, hashing, models, schema
+
+    schema.ensure()  # the app's lifespan does this, the in-process client below never runs it
+
+    password = hashing.get_password_hash(SEED_PASSWORD)  # one bcrypt for every seeded author
+    with database.SessionLocal() as db:
+        if not force and any(db.scalar(select(model.id).limit(1)) is not None for model in (models.DBAuthor, models.DBBlog)):
+            raise SystemExit(f"{config.DATABASE_URL} already has authors or blogs, pass --force to replace them")
+        db.execute(delete(models.DBBlog))
+        db.execute(delete(models.DBAuthor))
+        author_ids = db.execute(insert(models.DBAuthor).returning(models.DBAuthor.id), [
+            {"name": f"Author {i}", "email": f"author{i}@bench.local", "password": password} for i in range(authors)
+        ]).scalars().all()
+        blog_ids = db.execute(insert(models.DBBlog).returning(models.DBBlog.id), [
+            {"name": f"Blog {i}", "description": f"Synthetic post {i} " * 8, "author_id": rng.choice(author_ids)}
+            for i in range(blogs)
+        ]).scalars().all()
+        db.commit()
+    return sorted(author_ids), sorted(blog_ids)
+
+async def drive(client, make_request, total, concurrency):
+    """Sends total requests with at most concurrency in flight, returns the route's summary."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+async def run_routes(args, author_ids, blog_ids, rng):
+    import httpx
+    from .main import app
+
+    # Blogs from the top of the id range are set aside for the DELETE benchmark
+    deletable = blog_ids[-args.requests:]
+    readable = blog_ids[:-args.requests] or blog_ids
+    run_id = int(time.time())
+
+    def blog_body(i):
+        return {"id": 0, "name": f"Bench {i}", "description": "written by the benchmark", "author_id": rng.choice(author_ids)}
+
+    routes = {
+        "POST /blogs/": (args.requests, lambda i: ("POST", "/blogs/", {"json": blog_body(i)})),
+        "GET /blogs/{blog_id}": (args.requests, lambda i: ("GET", f"/blogs/{rng.choice(readable)}", {})),
+        "GET /blogs/": (args.requests, lambda i: ("GET", "/blogs/", {"params": {"after_id": rng.choice(readable)}})),
+        "GET /blogs/author/{author_id}": (args.requests, lambda i: ("GET", f"/blogs/author/{rng.choice(author_ids)}", {})),
+        "PUT /blogs/{blog_id}": (args.requests, lambda i: ("PUT", f"/blogs/{rng.choice(readable)}", {"json": blog_body(i)})),
+        "DELETE /blogs/{blog_id}": (len(deletable), lambda i: ("DELETE", f"/blogs/{deletable[i]}", {})),
+        "GET /authors/{author_id}": (args.requests, lambda i: ("GET", f"/authors/{rng.choice(author_ids)}", {})),
+        # The bcrypt routes are an order of magnitude slower, they get their own request count
+        "POST /authors/": (args.hash_requests, lambda i: ("POST", "/authors/", {"json": {
+            "name": f"Bench {i}", "email": f"bench{run_id}-{i}@bench.local", "password": SEED_PASSWORD,
+        }})),
+        "POST /authors/login": (args.hash_requests, lambda i: ("POST", "/authors/login", {"params": {
+            "email": f"author{rng.randrange(len(author_ids))}@bench.local", "password": SEED_PASSWORD,
+        }})),
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, (total, make_request) in routes.items():
+            results[name] = await drive(client, make_request, total, args.concurrency)
+            print(f"{name:32} {results[name]}", file=sys.stderr)
+    return results
+
+def time_function(func, iterations):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+def run_micro(args):
+    from fastapi import Request
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy import select, text
+    from . import compat, database, fastjson, hashing, models, queries, schemas
+
+    hashed = hashing.get_password_hash(SEED_PASSWORD)
+    with database.ReadSessionLocal() as db:
+        rows = db.execute(select(models.DBBlog).limit(args.page_size)).scalars().all()
+        column_rows = db.execute(queries.blog_rows_stmt(0).limit(args.page_size)).all()
+
+    def serialize_blog_list():
+        # The same steps FastAPI runs for response_model=List[schemas.Blogs]
+        json.dumps(jsonable_encoder([compat.from_orm(schemas.Blogs, row) for row in rows]))
+
+    def serialize_blog_rows():
+        # What the FAST_JSON=1 routes do with the column rows they select
+        fastjson.rows_response(column_rows)
+
+    def get_db_session():
+        request = Request({"type": "http", "method": "GET", "headers": [], "path": "/"})
+        dependency = database.get_db(request)
+        next(dependency).execute(text("SELECT 1"))
+        dependency.close()
+
+    results = {
+        "hashing.verify_password": time_function(lambda: hashing.verify_password(SEED_PASSWORD, hashed), args.hash_requests),
+        f"serialize List[schemas.Blogs] x{len(rows)}": time_function(serialize_blog_list, args.micro_iterations),
+        f"fastjson.rows_response x{len(column_rows)}": time_function(serialize_blog_rows, args.micro_iterations),
+        "database.get_db session setup": time_function(get_db_session, args.micro_iterations),
+    }
+    for name, summary in results.items():
+        print(f"{name:32} {summary}", file=sys.stderr)
+    return results
+
+def compare(report, baseline, max_regression):
+    """Returns the benchmarks whose p95 regressed by more than max_regression."""
+    regressions = []
+    for section in ("routes", "micro"):
+        for name, current in report[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if previous and previous["p95_ms"] > 0:
+                change = current["p95_ms"] / previous["p95_ms"] - 1
+                if change > max_regression:
+                    regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms (+{change:.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="database to seed and benchmark, defaults to a scratch file")
+    parser.add_argument("--force", action="store_true", help="seed --database-url even if it has rows, deleting them")
+    parser.add_argument("--authors", type=int, default=100)
+    parser.add_argument("--blogs", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--hash-requests", type=int, default=20, help="requests for the bcrypt routes and verify_password")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--micro-iterations", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100, help="blogs in the serialization benchmark")
+    parser.add_argument("--seed", type=int, default=1234, help="random seed, keep it fixed to compare runs")
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--compare", help="baseline report to gate on")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # read by config when the app is imported below
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        # The login benchmark times the route and bcrypt, not the 429s of the login rate limits
+        os.environ["LOGIN_RATE_LIMIT_IP"] = os.environ["LOGIN_RATE_LIMIT_EMAIL"] = "1000000/second"
+        from . import config, database
+
+        rng = random.Random(args.seed)
+        author_ids, blog_ids = seed(args.authors, args.blogs, rng, force=args.force)
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "database_url": args.database_url or "scratch",
+                "db_async": config.DB_ASYNC,
+                "fast_json": config.FAST_JSON,
+                "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "database_url", "force")},
+            },
+            "routes": asyncio.run(run_routes(args, author_ids, blog_ids, rng)),
+            "micro": run_micro(args),
+        }
+        database.engine.dispose()
+        database.read_engine.dispose()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import abc
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from . import config
+
+# Returned by backends for keys they do not hold, None is a valid cached value (a 404)
+MISSING = object()
+
+class CacheBackend(abc.ABC):
+    """Storage behind the read-through cache. Values are JSON compatible."""
+
+    @abc.abstractmethod
+    def get(self, key: str):
+        """The value stored for key, MISSING when there is none."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+class LRUCache(CacheBackend):
+    """In-process store that evicts the least recently used entry and expires entries after ttl seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "evictions": self.evictions, "expirations": self.expirations}
+
+class RedisCache(CacheBackend):
+    """Out-of-process store shared by every worker, needs the optional redis package."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "tut5:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+class ReadThroughCache:
+    """Loads missing keys through a loader, with one loader per key at a time.
+
+    Concurrent misses on the same key wait on a striped lock and are served from
+    the entry the first one stored, so a hot key expiring does not stampede SQLite.
+    The *_async methods do the same for async loaders with asyncio locks.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._stripes = [threading.Lock() for _ in range(self.STRIPES)]
+        self._async_stripes = [asyncio.Lock() for _ in range(self.STRIPES)]
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % self.STRIPES]
+
+    def _async_stripe(self, key):
+        return self._async_stripes[hash(key) % self.STRIPES]
+
+    def _count(self, hit: bool):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_or_load(self, key, loader):
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self._count(hit=True)
+            return value
+        with self._stripe(key):
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self._count(hit=True)
+                return value
+            self._count(hit=False)
+            value = loader()
+            self.backend.set(key, value)
+            return value
+
+    async def get_or_load_async(self, key, loader):
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self._count(hit=True)
+            return value
+        async with self._async_stripe(key):
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self._count(hit=True)
+                return value
+            self._count(hit=False)
+            value = await loader()
+            self.backend.set(key, value)
+            return value
+
+    def invalidate(self, *keys):
+        # Taking the key's stripe waits out a load that started before the write committed
+        for key in keys:
+            with self._stripe(key):
+                self.backend.delete(key)
+
+    async def invalidate_async(self, *keys):
+        for key in keys:
+            async with self._async_stripe(key):
+                self.backend.delete(key)
+
+    def stats(self):
+        with self._counter_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **self.backend.stats(),
+        }
+
+def build_backend() -> CacheBackend:
+    if config.CACHE_BACKEND == "redis":
+        return RedisCache(config.CACHE_REDIS_URL, config.CACHE_TTL_SECONDS)
+    return LRUCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS)
+
+entities = ReadThroughCache(build_backend())
+
+# Blog entries are keyed by their version (see versions.py), so a write makes the old
+# entry unreachable once the version is looked up again and blogs need no invalidation
+def blog_key(blog_id: int, version: str) -> str:
+    return f"blog:{blog_id}@{version}"
+
+def author_key(author_id: int) -> str:
+    return f"author:{author_id}"
+
+def invalidate_author(author_id: int):
+    entities.invalidate(author_key(author_id))
+    version_cache.delete(AUTHORS_VERSION_KEY)
+
+async def invalidate_author_async(author_id: int):
+    await entities.invalidate_async(author_key(author_id))
+    version_cache.delete(AUTHORS_VERSION_KEY)
+
+# The versions themselves are kept per process for VERSION_CACHE_TTL_SECONDS, so a hot
+# blog GET (or its 304) costs no query at all instead of a versions lookup per request.
+# The trade-off: writes made through this process drop the versions they change at once,
+# but a write by another worker or process is only seen once the entry expires, and
+# until then this worker keeps answering with the previous version and body.
+version_cache = LRUCache(config.CACHE_MAX_ENTRIES, config.VERSION_CACHE_TTL_SECONDS)
+
+AUTHORS_VERSION_KEY = "authors"
+
+def blog_version_key(blog_id: int) -> str:
+    return f"blogs:{blog_id}"
+
+def cached_version(key: str, load):
+    """The version under key, loaded on a miss. A row that does not exist is not cached,
+    so a blog created by another process is found right away."""
+    version = version_cache.get(key)
+    if version is MISSING:
+        version = load()
+        if version is not None:
+            version_cache.set(key, version)
+    return version
+
+async def cached_version_async(key: str, load):
+    version = version_cache.get(key)
+    if version is MISSING:
+        version = await load()
+        if version is not None:
+            version_cache.set(key, version)
+    return version
+
+def invalidate_blog_versions(*blog_ids: int):
+    version_cache.delete(*(blog_version_key(blog_id) for blog_id in blog_ids))
@@ -0,0 +1,88 @@
+"""In-memory NumPy columns of a table for the analytics endpoints (needs numpy).
+
+A ColumnarSnapshot holds the ids of a table, sorted, and one array per column. It is
+kept current through the version triggers of versions.py. When the collection version
+has not moved, refresh() costs that one primary key read. Otherwise only the rows
+stamped after the snapshot's version are read and merged in. Deleted rows leave no
+stamp, so when the row count no longer matches, the snapshot is reloaded in full.
+
+Readers get the arrays of a single version, and refreshes publish new arrays instead
+of changing the published ones in place.
+"""
+import threading
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from . import versions
+
+class ColumnarSnapshot:
+    def __init__(self, table: str, columns: Sequence[str], dtypes: Sequence[str]):
+        self.table = table
+        self.names = tuple(columns)
+        self.dtypes = tuple(dtypes)
+        self.version: Optional[int] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        # NULL reads as 0 (False for flags), numpy integer and bool columns have no null
+        select = ", ".join(f"coalesce(t.{name}, 0)" for name in self.names)
+        self._all_sql = text(f"SELECT t.id, {select} FROM {table} AS t ORDER BY t.id")
+        self._changed_sql = text(
+            f"SELECT t.id, {select} FROM {table}_versions AS v JOIN {table} AS t ON t.id = v.id "
+            "WHERE v.version > :since ORDER BY t.id"
+        )
+        self._count_sql = text(f"SELECT count(*) FROM {table}_versions")
+
+    def _arrays(self, rows) -> Dict[str, np.ndarray]:
+        values = list(zip(*rows)) or [()] * (len(self.names) + 1)
+        arrays = {"id": np.array(values[0], dtype=np.int64)}
+        for name, dtype, column in zip(self.names, self.dtypes, values[1:]):
+            arrays[name] = np.array(column, dtype=dtype)
+        return arrays
+
+    def _merge(self, changed: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        ids = self._columns["id"]
+        positions = np.searchsorted(ids, changed["id"])
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == changed["id"][found]
+        merged = {}
+        for name in ("id",) + self.names:
+            column = self._columns[name].copy()
+            column[positions[found]] = changed[name][found]
+            merged[name] = np.concatenate([column, changed[name][~found]])
+        if not found.all() and len(ids) and changed["id"][~found].min() < ids[-1]:
+            order = np.argsort(merged["id"], kind="stable")  # a reused id, keep ids sorted
+            merged = {name: column[order] for name, column in merged.items()}
+        return merged
+
+    def refresh(self, db) -> Dict[str, np.ndarray]:
+        """Brings the snapshot up to the version visible to db and returns its columns.
+        Run it in a read transaction so the version and the rows read agree."""
+        version = versions.collection_version(db, self.table)
+        if self.version is not None and version <= self.version:  # current, or db is an older transaction
+            return self._columns
+        with self._lock:
+            if self.version is None or version > self.version:
+                if self.version is None:
+                    columns = self._arrays(db.execute(self._all_sql).all())
+                else:
+                    columns = self._merge(self._arrays(db.execute(self._changed_sql, {"since": self.version}).all()))
+                    if len(columns["id"]) != db.execute(self._count_sql).scalar():
+                        columns = self._arrays(db.execute(self._all_sql).all())  # rows were deleted
+                self._columns, self.version = columns, version
+            return self._columns
+
+def combination_counts(*flags: np.ndarray) -> np.ndarray:
+    """Rows per combination of boolean columns: index i counts the rows whose flags
+    spell i in binary, the first flag being the most significant bit."""
+    code = np.zeros(len(flags[0]) if flags else 0, dtype=np.int64)
+    for flag in flags:
+        code = (code << 1) | flag.astype(np.int64)
+    return np.bincount(code, minlength=1 << len(flags))
+
+def top_counts(values: np.ndarray, limit: int):
+    """The limit most frequent values with their counts, most frequent first, ties by value."""
+    unique, counts = np.unique(values, return_counts=True)
+    order = np.lexsort((unique, -counts))[:limit]
+    return unique[order], counts[order]
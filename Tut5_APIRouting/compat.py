@@ -0,0 +1,28 @@
+"""pydantic v1 / v2 helpers, so the schemas and routes run on either major version."""
+from pydantic import BaseModel
+
+PYDANTIC_V2 = hasattr(BaseModel, "model_validate")
+
+def from_orm(model, obj):
+    """A model instance built from the attributes of an ORM object."""
+    if PYDANTIC_V2:
+        return model.model_validate(obj, from_attributes=True)
+    return model.from_orm(obj)
+
+def orm_dict(model, obj, **dump_kwargs) -> dict:
+    """An ORM object validated through model and dumped to a dict, e.g. for a cache."""
+    return to_dict(from_orm(model, obj), **dump_kwargs)
+
+def validate_dict(model, data: dict) -> dict:
+    return to_dict(model.model_validate(data) if PYDANTIC_V2 else model.parse_obj(data))
+
+def to_dict(instance, **dump_kwargs) -> dict:
+    return instance.model_dump(**dump_kwargs) if PYDANTIC_V2 else instance.dict(**dump_kwargs)
+
+def field_required(model, name: str) -> bool:
+    """Whether model has a field called name that has no default."""
+    if PYDANTIC_V2:
+        field = model.model_fields.get(name)
+        return field is not None and field.is_required()
+    field = model.__fields__.get(name)
+    return field is not None and field.required
@@ -0,0 +1,115 @@
+import os
+
+# Tuning knobs for the API, each one can be overridden through an environment variable
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sample.db")
+# Databases of the Tut3 and Tut4 apps, query_plans points them at scratch files
+TUT3_DATABASE_URL = os.getenv("TUT3_DATABASE_URL", "sqlite:///./places.db")
+TUT4_DATABASE_URL = os.getenv("TUT4_DATABASE_URL", "sqlite:///./Blogs.db")
+
+# Serve the blog and author routes from async def handlers on an AsyncSession (needs aiosqlite)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+
+# SQLite pragmas applied to every new connection, see engines.create_sqlite_engine
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+# Connection pools: SQLite has a single writer, so the write pool stays small while
+# GET routes share a larger pool of read-only connections
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "4"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "16"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Password hashing pool: bcrypt runs on HASH_POOL_SIZE dedicated threads and at most
+# HASH_QUEUE_SIZE further requests may wait for one before new ones are rejected with a 503
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", "4"))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "32"))
+
+# Read-through cache for single entity GETs: "memory" (per process LRU) or "redis"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Seconds a worker reuses the row/collection versions behind the blog ETags and cache
+# keys (cache.cached_version), 0 looks them up on every request
+VERSION_CACHE_TTL_SECONDS = float(os.getenv("VERSION_CACHE_TTL_SECONDS", "2"))
+
+# Bulk endpoints: items accepted per request and rows per IN (...) lookup
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+BULK_LOOKUP_CHUNK = int(os.getenv("BULK_LOOKUP_CHUNK", "500"))
+
+# Cache-Control sent with ETags on blog reads, "no-cache" lets clients keep the body
+# but makes them revalidate it with If-None-Match on every use
+HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "no-cache")
+
+# Send blog reads through fastjson.FastJSONResponse instead of response_model validation
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+# Write-behind mode for POST /blogs/ and PUT /blogs/{id}: 202 right away, then queued
+# writes are committed in batches of up to WRITE_BEHIND_BATCH_SIZE, or whatever arrived
+# within WRITE_BEHIND_BATCH_MS. A full queue answers 503. Outcomes of the last
+# WRITE_BEHIND_STATUS_ENTRIES writes can be polled.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_BATCH_MS = float(os.getenv("WRITE_BEHIND_BATCH_MS", "20"))
+WRITE_BEHIND_STATUS_ENTRIES = int(os.getenv("WRITE_BEHIND_STATUS_ENTRIES", "100000"))
+
+# Login rate limits (ratelimit.RateLimit), as "<count>/<period>" with period second,
+# minute, hour or day. Routes may pass their own. The "memory" store is per process,
+# "redis" is shared by every worker and uses CACHE_REDIS_URL.
+LOGIN_RATE_LIMIT_IP = os.getenv("LOGIN_RATE_LIMIT_IP", "30/minute")
+LOGIN_RATE_LIMIT_EMAIL = os.getenv("LOGIN_RATE_LIMIT_EMAIL", "5/minute")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Take the client IP from X-Forwarded-For, only behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+# Password hashing scheme for new hashes: "bcrypt" or "argon2id" (needs argon2-cffi).
+# Existing hashes of another scheme or cost still verify, and are rehashed after a login.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "bcrypt")
+# bcrypt cost, or "auto" to use the highest cost whose verify takes at most BCRYPT_TARGET_MS
+# here, measured at startup (python -m Tut5_APIRouting.hashing prints the same calibration)
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS", "12")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+# argon2id cost: iterations, memory per hash in KiB and lanes
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+# Import the route modules after startup instead of at import (see main.LazyRoutersMiddleware),
+# for a faster cold start of new workers. The first requests wait until they are loaded.
+LAZY_ROUTERS = os.getenv("LAZY_ROUTERS", "0") == "1"
+
+# Pre-fork launcher (python -m Tut5_APIRouting.serve): workers (0 = one per available core),
+# requests before a worker is recycled (0 = never) plus a random jitter, seconds a draining
+# worker gets to finish its requests, seconds without a heartbeat before a worker is killed,
+# and the port of the per-worker health report (0 = off)
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "10000"))
+SERVE_MAX_REQUESTS_JITTER = int(os.getenv("SERVE_MAX_REQUESTS_JITTER", "1000"))
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_WORKER_TIMEOUT = float(os.getenv("SERVE_WORKER_TIMEOUT", "30"))
+SERVE_HEALTH_PORT = int(os.getenv("SERVE_HEALTH_PORT", "0"))
+# A crashed worker is restarted after SERVE_RESPAWN_BACKOFF seconds, doubled on every
+# further crash of its slot up to SERVE_RESPAWN_BACKOFF_MAX. After SERVE_MAX_CRASHES
+# crashes in a row the launcher shuts down (0 = keep restarting forever)
+SERVE_RESPAWN_BACKOFF = float(os.getenv("SERVE_RESPAWN_BACKOFF", "0.5"))
+SERVE_RESPAWN_BACKOFF_MAX = float(os.getenv("SERVE_RESPAWN_BACKOFF_MAX", "30"))
+SERVE_MAX_CRASHES = int(os.getenv("SERVE_MAX_CRASHES", "10"))
+
+# CSV/Parquet transfers (tabular.py): rows per export batch (one cursor fetch, one encoder
+# call, one Parquet row group) and per import transaction. Parquet uploads are spooled in
+# memory up to IMPORT_SPOOL_MAX_BYTES, then to a temporary file. An import reports at most
+# IMPORT_MAX_ERRORS rejected rows individually.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "1000"))
+IMPORT_SPOOL_MAX_BYTES = int(os.getenv("IMPORT_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+
+# Serve the /analytics aggregates from NumPy columns kept in memory (needs numpy). A poll
+# costs one version read while nothing changed, and a read of the changed rows otherwise.
+ANALYTICS_SNAPSHOT = os.getenv("ANALYTICS_SNAPSHOT", "0") == "1"
@@ -1,16 +1,52 @@
-from sqlalchemy import create_engine
+from fastapi import Request
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./sample.db"
+from . import config
+from .engines import READ_METHODS, create_async_sqlite_engine, create_sqlite_engine
+
+DATABASE_URL = config.DATABASE_URL
+
+engine = create_sqlite_engine(DATABASE_URL)
+read_engine = create_sqlite_engine(DATABASE_URL, read_only=True, pool_size=config.DB_READ_POOL_SIZE)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
+# Dependency to get the database session, GET routes get a read-only one
+def get_db(request: Request):
+    db = ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Read-only session for non-GET routes that only look rows up (login) or check
+# before a slow step, so they never take or wait on the SQLite write lock
+def get_read_db():
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# The async engines are only built when DB_ASYNC is on, so aiosqlite stays optional
+if config.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = create_async_sqlite_engine(config.ASYNC_DATABASE_URL)
+    async_read_engine = create_async_sqlite_engine(
+        config.ASYNC_DATABASE_URL, read_only=True, pool_size=config.DB_READ_POOL_SIZE
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
+# Async counterpart of get_db for the async routers
+async def get_async_db(request: Request):
+    session_factory = AsyncReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
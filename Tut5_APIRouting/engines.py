@@ -0,0 +1,74 @@
+"""SQLite engine factories, shared by the Tut5 database and the tutorial apps.
+
+Only config is needed to build an engine, so importing this module does not create
+the Tut5 engines the way importing database.py does.
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from . import config
+
+READ_METHODS = {"GET", "HEAD"}
+
+def _install_sqlite_hooks(engine, read_only: bool):
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see _begin) instead of the sqlite3 module
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+def create_sqlite_engine(
+    url: str,
+    read_only: bool = False,
+    pool_size: int = config.DB_WRITE_POOL_SIZE,
+    max_overflow: int = config.DB_MAX_OVERFLOW,
+):
+    """Engine for a SQLite file tuned for concurrent use.
+
+    Every connection runs in WAL mode with synchronous=NORMAL, a busy timeout and
+    bigger page cache/mmap windows. Write engines start transactions with BEGIN
+    IMMEDIATE so concurrent writers queue on the busy timeout instead of failing with
+    "database is locked"; read-only engines refuse writes through query_only.
+    """
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    _install_sqlite_hooks(engine, read_only)
+    return engine
+
+def create_async_sqlite_engine(
+    url: str,
+    read_only: bool = False,
+    pool_size: int = config.DB_WRITE_POOL_SIZE,
+    max_overflow: int = config.DB_MAX_OVERFLOW,
+):
+    """aiosqlite counterpart of create_sqlite_engine, with the same pragmas and pooling."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(
+        url,
+        connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    _install_sqlite_hooks(engine.sync_engine, read_only)
+    return engine
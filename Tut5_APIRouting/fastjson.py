@@ -0,0 +1,42 @@
+"""Opt-in fast JSON responses (FAST_JSON=1).
+
+With a response_model, FastAPI validates what a route returns against the model,
+runs jsonable_encoder over the result and then json.dumps. For rows that were
+selected as exactly the model's columns, or dicts that were validated when they
+were cached, that work is redundant. Routes on the fast path return a
+FastJSONResponse instead, which FastAPI sends as is, encoded by orjson when it is
+installed. The decorators keep their response_model, so the documented schema
+does not change.
+"""
+import json
+from typing import Optional
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is the fallback
+    orjson = None
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def json_response(content, response: Optional[Response] = None) -> FastJSONResponse:
+    """Wraps content, keeping the headers the route set on its injected response
+    (ETag, X-Next-Cursor), which FastAPI drops when a route returns a Response."""
+    fast = FastJSONResponse(content)
+    if response is not None:
+        fast.raw_headers.extend((name, value) for name, value in response.raw_headers if name != b"content-length")
+    return fast
+
+def rows_response(rows, response: Optional[Response] = None) -> FastJSONResponse:
+    """For rows of a column select whose columns are the response model's fields."""
+    return json_response([row._asdict() for row in rows], response)
@@ -1,7 +1,209 @@
+import abc
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 import bcrypt
+from fastapi import HTTPException, status
+
+from web_common import metrics
+
+from . import config
+
+class PasswordHasher(abc.ABC):
+    """A password hashing scheme. Stored hashes are verified by whichever hasher
+    identifies them, so hashes of an older scheme or cost keep working and are
+    replaced by the login routes after the next successful login."""
+
+    @abc.abstractmethod
+    def hash(self, password: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def verify(self, password: str, hashed: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def identifies(self, hashed: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def needs_rehash(self, hashed: str) -> bool:
+        ...
+
+class BcryptHasher(PasswordHasher):
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+
+    def hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def identifies(self, hashed):
+        return hashed.startswith(("$2a$", "$2b$", "$2y$"))
+
+    def needs_rehash(self, hashed):
+        return int(hashed.split("$")[2]) != self.rounds  # $2b$<cost>$<salt and hash>
+
+class Argon2Hasher(PasswordHasher):
+    """argon2id, needs the optional argon2-cffi package. Every verify takes memory_kib
+    of memory, so the hashing pool bounds it at HASH_POOL_SIZE * memory_kib."""
+
+    def __init__(self, time_cost: int, memory_kib: int, parallelism: int):
+        from argon2 import PasswordHasher as Argon2, Type
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        self._argon2 = Argon2(time_cost=time_cost, memory_cost=memory_kib, parallelism=parallelism, type=Type.ID)
+        self._errors = (InvalidHashError, VerificationError)
+
+    def hash(self, password):
+        return self._argon2.hash(password)
+
+    def verify(self, password, hashed):
+        try:
+            return self._argon2.verify(hashed, password)
+        except self._errors:
+            return False
+
+    def identifies(self, hashed):
+        return hashed.startswith("$argon2")
+
+    def needs_rehash(self, hashed):
+        return self._argon2.check_needs_rehash(hashed)
+
+def calibrate_bcrypt(target_ms: float, min_rounds: int = 10, max_rounds: int = 16, samples: int = 3):
+    """The highest bcrypt cost whose verify takes at most target_ms on this machine,
+    never below min_rounds. Returns (rounds, {rounds: verify ms})."""
+    chosen, timings = min_rounds, {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        hashed = bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        elapsed = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.checkpw(b"calibration", hashed)
+            elapsed.append((time.perf_counter() - start) * 1000)
+        timings[rounds] = min(elapsed)
+        if timings[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+def build_hasher() -> PasswordHasher:
+    if config.PASSWORD_HASHER == "argon2id":
+        return Argon2Hasher(config.ARGON2_TIME_COST, config.ARGON2_MEMORY_KIB, config.ARGON2_PARALLELISM)
+    if config.BCRYPT_ROUNDS == "auto":
+        return BcryptHasher(calibrate_bcrypt(config.BCRYPT_TARGET_MS, samples=1)[0])
+    return BcryptHasher(int(config.BCRYPT_ROUNDS))
+
+hasher = build_hasher()
+# Verifies the bcrypt hashes left from before a switch to argon2id, the cost is read from each hash
+_bcrypt_verifier = BcryptHasher(12)
+
+def _hasher_for(hashed: str) -> Optional[PasswordHasher]:
+    if hasher.identifies(hashed):
+        return hasher
+    if _bcrypt_verifier.identifies(hashed):
+        return _bcrypt_verifier
+    return None
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hasher.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    scheme = _hasher_for(hashed_password)
+    return scheme is not None and scheme.verify(plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash is of another scheme or cost than new hashes get."""
+    return not hasher.identifies(hashed_password) or hasher.needs_rehash(hashed_password)
+
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing off the
+# shared request threadpool without starving the other routes
+_executor = ThreadPoolExecutor(max_workers=config.HASH_POOL_SIZE, thread_name_prefix="hashing")
+_slots = threading.BoundedSemaphore(config.HASH_POOL_SIZE + config.HASH_QUEUE_SIZE)
+_lock = threading.Lock()
+_stats = {"submitted": 0, "rejected": 0, "in_flight": 0, "rehashed": 0}
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+async def _run_in_pool(operation, func, *args):
+    if not _slots.acquire(blocking=False):
+        with _lock:
+            _stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    with _lock:
+        _stats["submitted"] += 1
+        _stats["in_flight"] += 1
+    try:
+        result, elapsed = await asyncio.get_running_loop().run_in_executor(_executor, _timed, func, *args)
+        metrics.record_hashing(operation, elapsed)
+        return result
+    finally:
+        with _lock:
+            _stats["in_flight"] -= 1
+        _slots.release()
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_pool("hash", get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool("verify", verify_password, plain_password, hashed_password)
+
+def _hash_all(passwords: List[str]) -> List[str]:
+    return [get_password_hash(password) for password in passwords]
+
+# Hashes a batch HASH_POOL_SIZE passwords at a time, one after the other, so a bulk import
+# takes at most one hashing thread away from logins and gives its slot back between
+# chunks, where a full pool answers it with a 503 like any other caller
+async def get_password_hashes_async(passwords: List[str]) -> List[str]:
+    hashes = []
+    for start in range(0, len(passwords), config.HASH_POOL_SIZE):
+        hashes += await _run_in_pool("hash_batch", _hash_all, passwords[start:start + config.HASH_POOL_SIZE])
+    return hashes
+
+async def rehash_async(password: str) -> Optional[str]:
+    """A new hash for a password that just verified, None when the pool is full,
+    in which case a later login retries."""
+    try:
+        hashed = await _run_in_pool("rehash", get_password_hash, password)
+    except HTTPException:
+        return None
+    with _lock:
+        _stats["rehashed"] += 1
+    return hashed
+
+def pool_stats() -> dict:
+    with _lock:
+        in_flight = _stats["in_flight"]
+        return {
+            "workers": config.HASH_POOL_SIZE,
+            "max_queue": config.HASH_QUEUE_SIZE,
+            "in_flight": in_flight,
+            "queue_depth": max(0, in_flight - config.HASH_POOL_SIZE),
+            "submitted": _stats["submitted"],
+            "rejected": _stats["rejected"],
+            "rehashed": _stats["rehashed"],
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the bcrypt cost for a target verify time on this machine")
+    parser.add_argument("--target-ms", type=float, default=config.BCRYPT_TARGET_MS)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+    rounds, timings = calibrate_bcrypt(args.target_ms, args.min_rounds, args.max_rounds)
+    for cost, ms in timings.items():
+        print(f"cost {cost:2}: {ms:8.1f} ms per verify")
+    print(f"BCRYPT_ROUNDS={rounds}")
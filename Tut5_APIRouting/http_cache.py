@@ -0,0 +1,28 @@
+from fastapi import Request, Response
+
+from . import config
+
+# Strong ETags and conditional GETs. Routes build the tag from row or collection
+# versions (see versions.py) and answer a matching If-None-Match with an empty 304
+# before loading or serializing anything.
+
+def etag(*parts) -> str:
+    return '"' + ".".join(str(part) for part in parts) + '"'
+
+def is_fresh(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, a W/ prefix on the client's copy still matches
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in header.split(","))
+
+def set_headers(response: Response, tag: str) -> None:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = config.HTTP_CACHE_CONTROL
+
+def not_modified(tag: str) -> Response:
+    response = Response(status_code=304)
+    set_headers(response, tag)
+    return response
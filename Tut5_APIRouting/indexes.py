@@ -0,0 +1,28 @@
+"""Index migration shared by the Tut3, Tut4 and Tut5 schemas.
+
+create_all only creates the indexes of the tables it creates, so an existing
+database never gets an index declared on a model later. add_missing_indexes adds
+them. It only needs a connection and a MetaData, not the Tut5 models or engine,
+so the tutorial apps can run it against their own databases.
+"""
+
+def _indexed_columns(connection, table: str) -> set:
+    """(columns, unique) of every index on table, the implicit ones of UNIQUE included."""
+    indexed = set()
+    for _, name, unique, *_ in connection.exec_driver_sql(f"PRAGMA index_list({table})").all():
+        columns = tuple(row[2] for row in connection.exec_driver_sql(f'PRAGMA index_info("{name}")').all())
+        indexed.add((columns, bool(unique)))
+    return indexed
+
+def add_missing_indexes(connection, metadata) -> list:
+    """Creates the indexes declared in metadata that the existing tables lack and returns
+    their names. An index is skipped when one on the same columns with the same
+    uniqueness is there already, e.g. the one SQLite made for a UNIQUE constraint."""
+    created = []
+    for table in metadata.sorted_tables:
+        indexed = _indexed_columns(connection, table.name)
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if (tuple(column.name for column in index.columns), bool(index.unique)) not in indexed:
+                index.create(connection)
+                created.append(index.name)
+    return created
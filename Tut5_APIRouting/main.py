@@ -1,16 +1,102 @@
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from web_common import compression, metrics
+
+from . import config, database, hashing, cache, schema, write_behind
+
+# Router modules in registration order, bulk, search and transfer first so their paths are not matched as ids
+ROUTERS = (
+    "bulk",
+    "search",
+    "transfer",
+    "blog_async" if config.DB_ASYNC else "blog",
+    "author_async" if config.DB_ASYNC else "author",
+    "analytics",
+)
+
+def include_routers(app: FastAPI):
+    for name in ROUTERS:
+        app.include_router(importlib.import_module(f".routers.{name}", __package__).router)
+
+_routers_loaded = None
+
+def load_routers(app: FastAPI):
+    """Starts importing and registering the routers on a worker thread, once."""
+    global _routers_loaded
+    if _routers_loaded is None:
+        _routers_loaded = asyncio.ensure_future(run_in_threadpool(include_routers, app))
+    return _routers_loaded
 
-from .routers import author
-from .routers import blog
-from .database import engine
-from . import models
+class LazyRoutersMiddleware:
+    """With LAZY_ROUTERS=1 the routers are loaded once the app has started, so a new
+    worker accepts connections without importing them first. Requests arriving before
+    they are registered wait for them."""
 
-models.Base.metadata.create_all(bind=engine)
+    def __init__(self, app):
+        self.app = app
 
-app = FastAPI()
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await asyncio.shield(load_routers(scope["app"]))
+        await self.app(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pragma read once the database is at schema.SCHEMA_VERSION
+    await run_in_threadpool(schema.ensure)
+    if config.LAZY_ROUTERS:
+        load_routers(app)
+    yield
+    # Commit whatever the write-behind queue still holds before the process exits
+    await run_in_threadpool(write_behind.blog_writes.flush)
+
+app = FastAPI(lifespan=lifespan)
 # run using the command
 # C:\Users\Dell\Desktop\FASTAPI_SERIES>uvicorn Tut5_APIRouting.main:app --reload
+# set DB_ASYNC=1 to serve the routes from async handlers on aiosqlite
+# python -m Tut5_APIRouting.serve --port 8000 runs one pre-forked worker per core
+
+# gzip/brotli for JSON bodies above the size threshold, added first so /metrics timings include it
+compression.install(app)
+# Latency, SQL and hashing time per route, served on /metrics
+if config.DB_ASYNC:
+    metrics.install(app, database.engine, database.read_engine,
+                    database.async_engine.sync_engine, database.async_read_engine.sync_engine)
+else:
+    metrics.install(app, database.engine, database.read_engine)
+metrics.register(metrics.Gauge(
+    "hashing_pool", "Password hashing pool state", lambda: {(k,): v for k, v in hashing.pool_stats().items()}, ("stat",)
+))
+metrics.register(metrics.Gauge(
+    "write_behind", "Write-behind queue state", lambda: {(k,): v for k, v in write_behind.blog_writes.stats().items()}, ("stat",)
+))
+metrics.register(metrics.Gauge(
+    "entity_cache", "Entity cache counters",
+    lambda: {(k,): v for k, v in cache.entities.stats().items() if isinstance(v, (int, float))}, ("stat",)
+))
+
+# Register Routers, now or after startup with LAZY_ROUTERS=1
+if config.LAZY_ROUTERS:
+    app.add_middleware(LazyRoutersMiddleware)
+else:
+    include_routers(app)
+
+# Password hashing pool load: queue depth and rejected requests
+@app.get("/stats/hashing", tags=["Stats"])
+def hashing_stats():
+    return hashing.pool_stats()
+
+# Entity cache hit/miss/eviction counters
+@app.get("/stats/cache", tags=["Stats"])
+def cache_stats():
+    return cache.entities.stats()
 
-# Register Routers
-app.include_router(blog.router)
-app.include_router(author.router)
+# Write-behind queue depth, batches and outcomes
+@app.get("/stats/writes", tags=["Stats"])
+def write_stats():
+    return write_behind.blog_writes.stats()
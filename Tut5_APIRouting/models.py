@@ -8,7 +8,9 @@ class DBBlog(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50))
     description = Column(String, nullable=True)
-    author_id = Column(Integer, ForeignKey('authors.id'))
+    # SQLite keeps the rowid (id) in every index entry, so this index is in fact
+    # (author_id, id): one author's blogs come out of it already ordered by id
+    author_id = Column(Integer, ForeignKey('authors.id'), index=True)
 
     writer = relationship("DBAuthor", back_populates="writings")
 
@@ -17,7 +19,7 @@ class DBAuthor(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50))
-    email = Column(String, unique=True)
+    email = Column(String, unique=True, index=True)  # login and sign-up lookups
     password = Column(String)
 
     writings = relationship("DBBlog", back_populates="writer")
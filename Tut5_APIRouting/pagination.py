@@ -0,0 +1,68 @@
+import base64
+import json
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+STREAM_CHUNK_SIZE = 1000
+
+# Cursors are opaque to clients: a urlsafe base64 of the last id they have seen
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after_id": last_id}).encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["after_id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def resolve_after_id(after_id: Optional[int], cursor: Optional[str]) -> int:
+    if cursor:
+        return decode_cursor(cursor)
+    return after_id or 0
+
+def _ndjson_chunk(rows) -> str:
+    return "".join(json.dumps(row._asdict()) + "\n" for row in rows)
+
+# Streams a statement selecting plain columns, STREAM_CHUNK_SIZE rows at a time, so rows
+# are never turned into ORM objects. The stream outlives the request's get_db session,
+# so it owns a read session of its own, from session_factory for another database.
+# The Tut5 database is imported on first use, so Tut3 and Tut4 never build its engines.
+def ndjson_response(stmt: Select, session_factory: Optional[Callable] = None) -> StreamingResponse:
+    if session_factory is None:
+        from .database import ReadSessionLocal as session_factory
+
+    def generate():
+        db = session_factory()
+        try:
+            result = db.execute(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            for rows in result.partitions():
+                yield _ndjson_chunk(rows)
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def ndjson_response_async(stmt: Select) -> StreamingResponse:
+    from .database import AsyncReadSessionLocal
+
+    async def generate():
+        async with AsyncReadSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            async for rows in result.partitions():
+                yield _ndjson_chunk(rows)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# Search results are ordered by (rank, id), so their cursors carry both
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"rank": rank, "after_id": last_id}).encode()).decode()
+
+def decode_rank_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(data["rank"]), int(data["after_id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,102 @@
+from typing import List, Optional
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.orm import Session, joinedload, raiseload
+
+from . import config, models
+
+# Loader strategies for each read path. Everything a route serializes is loaded by the
+# route's single SELECT, and relationships it does not serialize are never lazy loaded:
+# reading the writer of a blog loaded without it raises instead of querying, so those
+# blogs are serialized through schemas.Blogs, which has no writer
+def blog_loader(include_writer: bool = False):
+    if include_writer:
+        return joinedload(models.DBBlog.writer)
+    return raiseload(models.DBBlog.writer)
+
+AUTHOR_WITH_WRITINGS = joinedload(models.DBAuthor.writings)
+
+# Statements are shared by the sync helpers below and the async routers,
+# which execute them on an AsyncSession
+def author_exists_stmt(author_id: int):
+    return select(exists().where(models.DBAuthor.id == author_id))
+
+def email_registered_stmt(email: str):
+    return select(exists().where(models.DBAuthor.email == email))
+
+def blog_exists_stmt(blog_id: int):
+    return select(exists().where(models.DBBlog.id == blog_id))
+
+def blog_stmt(blog_id: int, include_writer: bool = False):
+    return select(models.DBBlog).options(blog_loader(include_writer)).where(models.DBBlog.id == blog_id)
+
+def blog_page_stmt(after_id: int, limit: int, include_writer: bool = False):
+    return (
+        select(models.DBBlog)
+        .options(blog_loader(include_writer))
+        .where(models.DBBlog.id > after_id)
+        .order_by(models.DBBlog.id)
+        .limit(limit)
+    )
+
+# Exactly the fields of schemas.Blogs, for routes that skip building ORM objects
+BLOG_COLUMNS = (models.DBBlog.id, models.DBBlog.name, models.DBBlog.description, models.DBBlog.author_id)
+
+def blog_rows_stmt(after_id: int):
+    return select(*BLOG_COLUMNS).where(models.DBBlog.id > after_id).order_by(models.DBBlog.id)
+
+def author_blog_rows_stmt(author_id: int):
+    return select(*BLOG_COLUMNS).where(models.DBBlog.author_id == author_id).order_by(models.DBBlog.id)
+
+# One LEFT OUTER JOIN tells a missing author (None) apart from an author without blogs
+def author_with_blogs_stmt(author_id: int):
+    return select(models.DBAuthor).options(AUTHOR_WITH_WRITINGS).where(models.DBAuthor.id == author_id)
+
+def author_stmt(author_id: int):
+    return select(models.DBAuthor).where(models.DBAuthor.id == author_id)
+
+def author_by_email_stmt(email: str):
+    return select(models.DBAuthor).where(models.DBAuthor.email == email)
+
+# Replaces a password hash only if it is still the one that was verified, so a password
+# changed in the meantime is not overwritten with a rehash of the old one
+def password_rehash_stmt(author_id: int, old_hash: str, new_hash: str):
+    return (
+        update(models.DBAuthor)
+        .where(models.DBAuthor.id == author_id, models.DBAuthor.password == old_hash)
+        .values(password=new_hash)
+    )
+
+def author_exists(db: Session, author_id: int) -> bool:
+    return db.execute(author_exists_stmt(author_id)).scalar()
+
+def email_registered(db: Session, email: str) -> bool:
+    return db.execute(email_registered_stmt(email)).scalar()
+
+def blog_exists(db: Session, blog_id: int) -> bool:
+    return db.execute(blog_exists_stmt(blog_id)).scalar()
+
+def get_blog(db: Session, blog_id: int, include_writer: bool = False) -> Optional[models.DBBlog]:
+    return db.execute(blog_stmt(blog_id, include_writer)).scalars().first()
+
+def list_blogs(db: Session, after_id: int, limit: int, include_writer: bool = False) -> List[models.DBBlog]:
+    return db.execute(blog_page_stmt(after_id, limit, include_writer)).scalars().all()
+
+def get_author_by_email(db: Session, email: str) -> Optional[models.DBAuthor]:
+    return db.execute(author_by_email_stmt(email)).scalars().first()
+
+def get_author_with_blogs(db: Session, author_id: int) -> Optional[models.DBAuthor]:
+    return db.execute(author_with_blogs_stmt(author_id)).unique().scalars().first()
+
+# Distinct values in IN (...) lists of at most BULK_LOOKUP_CHUNK, below SQLite's bound parameter limit
+def in_chunks(values):
+    values = list(set(values))
+    for start in range(0, len(values), config.BULK_LOOKUP_CHUNK):
+        yield values[start:start + config.BULK_LOOKUP_CHUNK]
+
+# The values of column that exist among values, e.g. the known author ids of a batch
+def existing(db: Session, column, values) -> set:
+    found = set()
+    for chunk in in_chunks(values):
+        found.update(db.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
@@ -0,0 +1,201 @@
+"""Checks that the Tut3, Tut4 and Tut5 routes answer from an index, with EXPLAIN QUERY PLAN.
+
+    python -m Tut5_APIRouting.query_plans [--database-url sqlite:///./plans.db] [--verbose]
+
+It seeds a scratch database for each app (for Tut5 the one given instead, which needs
+--force when it has rows, like benchmark.py), sends each request of ROUTES,
+TUT3_ROUTES and TUT4_ROUTES once through an in-process client and records the SQL
+the route executes.
+Every statement is then explained with the parameters it ran with. A SCAN of a table
+(the whole table, or the whole of one of its indexes) fails the route unless it is
+listed as reading the whole table by design, like the export. The run exits with
+status 1 on a failure, so CI can run it after a change to models.py or queries.py.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+
+from . import benchmark
+
+# method, path, request arguments, whether the route reads the whole table by design
+ROUTES = (
+    ("GET", "/blogs/1", {}, False),
+    ("GET", "/blogs/1?include=writer", {}, False),
+    ("GET", "/blogs/?limit=10", {}, False),
+    ("GET", "/blogs/?limit=10&after_id=10&include=writer", {}, False),
+    ("GET", "/blogs/?stream=true", {}, False),
+    ("GET", "/blogs/author/1", {}, False),
+    ("GET", "/blogs/search?q=synthetic", {}, False),
+    ("POST", "/blogs/", {"json": {"id": 0, "name": "Plan", "description": "Checked", "author_id": 1}}, False),
+    ("PUT", "/blogs/2", {"json": {"id": 2, "name": "Plan", "description": "Updated", "author_id": 1}}, False),
+    ("DELETE", "/blogs/3", {}, False),
+    ("POST", "/blogs/bulk", {"json": [{"name": "Bulk", "description": "Plan", "author_id": 2}]}, False),
+    ("PATCH", "/blogs/bulk", {"json": [{"id": 4, "name": "Bulk"}]}, False),
+    ("DELETE", "/blogs/bulk", {"json": {"ids": [5, 6]}}, False),
+    ("GET", "/authors/1", {}, False),
+    ("POST", "/authors/", {"json": {"name": "Plan", "email": "plan@bench.local", "password": "plan"}}, False),
+    ("POST", "/authors/login", {"params": {"email": "author0@bench.local", "password": benchmark.SEED_PASSWORD}}, False),
+    ("POST", "/authors/bulk", {"json": [{"name": "Bulk", "email": "bulk@bench.local", "password": "plan"}]}, False),
+    ("GET", "/blogs/export", {}, True),
+    ("GET", "/analytics/blogs-per-author", {}, True),  # counts every blog
+)
+
+TUT3_ROUTES = (
+    ("POST", "/token", {"data": {"username": "user1@plans.local", "password": benchmark.SEED_PASSWORD}}, False),
+    ("POST", "/create-user", {"json": {"name": "Plan", "email": "plan@plans.local", "password": "plan"}}, False),
+    ("GET", "/get-user/1", {}, False),
+    ("GET", "/get-place/1", {}, False),
+    ("GET", "/get-all-places?limit=10&after_id=10", {}, False),
+    ("PUT", "/update-place/2", {"json": {"id": 2, "name": "Plan", "coffee": True, "wifi": True, "food": False}}, False),
+    ("DELETE", "/delete-place/3", {}, False),
+)
+
+TUT4_ROUTES = (
+    ("GET", "/get-blog/1", {}, False),
+    ("GET", "/get-all-blogs?limit=10&after_id=10", {}, False),
+    ("GET", "/get-all-blogs?stream=true", {}, False),
+    ("GET", "/get-author-blogs/1", {}, False),
+    ("GET", "/get-author/1", {}, False),
+    ("POST", "/create-blog/", {"json": {"id": 0, "name": "Plan", "description": "Checked", "author_id": 1}}, False),
+    ("PUT", "/update-blog/2", {"json": {"id": 2, "name": "Plan", "description": "Updated", "author_id": 1}}, False),
+    ("DELETE", "/delete-blog/3", {}, False),
+    ("POST", "/create-author", {"json": {"name": "Plan", "email": "plan@plans.local", "password": "plan"}}, False),
+    ("POST", "/login", {"params": {"email": "author1@plans.local", "password": benchmark.SEED_PASSWORD}}, False),
+)
+
+EXPLAINED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\S+)")
+
+def full_scans(connection, statement, parameters) -> list:
+    """The plan steps of statement that read a whole table or index. Tables show under
+    their alias, so any SCAN counts but those of subqueries, constant rows and the FTS
+    index. An automatic index is built from a full scan on every run, so it counts too."""
+    plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters))]
+    subqueries = {match.group(1) for match in map(SUBQUERY.match, plan) if match}
+    scans = []
+    for detail in plan:
+        match = SCAN.match(detail)
+        if match and match.group(1) not in subqueries and not match.group(1).startswith("(") \
+                and "CONSTANT ROW" not in detail and "VIRTUAL TABLE" not in detail:
+            scans.append(detail)
+        elif "AUTOMATIC" in detail:
+            scans.append(detail)
+    return scans
+
+def record_statements(client, routes):
+    """Sends every route once and returns the statements each executed, in order."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    executed = {}
+    current = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if current and statement.lstrip().upper().startswith(EXPLAINED):
+            params = parameters[0] if executemany and parameters else parameters
+            executed[current[0]].append((statement, params or ()))
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    try:
+        for method, path, kwargs, _ in routes:
+            key = f"{method} {path}"
+            executed[key], current[:] = [], [key]
+            response = client.request(method, path, **kwargs)
+            current.clear()
+            if response.status_code >= 400:
+                raise SystemExit(f"{key} answered {response.status_code}: {response.text}")
+    finally:
+        event.remove(Engine, "before_cursor_execute", capture)
+    return executed
+
+def seed_tut3(app_module, users, places):
+    """Users and places for TUT3_ROUTES, user i has the email user{i}@plans.local."""
+    from sqlalchemy import insert
+
+    password = app_module.get_password_hash(benchmark.SEED_PASSWORD)
+    with app_module.SessionLocal() as db:
+        db.execute(insert(app_module.DBUser), [
+            {"name": f"User {i}", "email": f"user{i}@plans.local", "password": password} for i in range(1, users + 1)
+        ])
+        db.execute(insert(app_module.DBPlace), [
+            {"name": f"Place {i}", "description": "Seeded", "coffee": i % 2 == 0, "wifi": True, "food": i % 3 == 0}
+            for i in range(places)
+        ])
+        db.commit()
+
+def seed_tut4(app_module, authors, blogs, rng):
+    """Authors and blogs for TUT4_ROUTES, author i has the email author{i}@plans.local."""
+    from sqlalchemy import insert
+
+    password = app_module.get_password_hash(benchmark.SEED_PASSWORD)
+    with app_module.SessionLocal() as db:
+        db.execute(insert(app_module.DBAuthor), [
+            {"name": f"Author {i}", "email": f"author{i}@plans.local", "password": password} for i in range(1, authors + 1)
+        ])
+        db.execute(insert(app_module.DBBlog), [
+            {"name": f"Blog {i}", "description": "Seeded", "author_id": rng.randint(1, authors)} for i in range(blogs)
+        ])
+        db.commit()
+
+def check(client, routes, read_engine, verbose) -> int:
+    """Sends routes through client and prints their full scans, returns the failed routes."""
+    executed = record_statements(client, routes)
+    failures = 0
+    with read_engine.connect() as connection:
+        for method, path, _, whole_table in routes:
+            key = f"{method} {path}"
+            problems = []
+            for statement, parameters in executed[key]:
+                scans = full_scans(connection, statement, parameters)
+                if verbose:
+                    print(f"  {' '.join(statement.split())}\n    {scans or 'no full scan'}")
+                if scans and not whole_table:
+                    problems.append((statement, scans))
+            failures += bool(problems)
+            print(f"{'FULL SCAN' if problems else 'ok':9} {key} ({len(executed[key])} statements)")
+            for statement, scans in problems:
+                print(f"    {' '.join(statement.split())}\n      " + "\n      ".join(scans))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Tut5 database to seed and check, defaults to a scratch file")
+    parser.add_argument("--force", action="store_true", help="seed --database-url even if it has rows, deleting them")
+    parser.add_argument("--authors", type=int, default=20)
+    parser.add_argument("--blogs", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # read by config when the apps are imported below
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(scratch, 'plans.db')}"
+        os.environ["TUT3_DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'places.db')}"
+        os.environ["TUT4_DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'blogs.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        from fastapi.testclient import TestClient
+        from . import database
+        from .main import app
+        import Tut3
+        import Tut4
+
+        rng = random.Random(0)
+        seed_tut3(Tut3, args.authors, args.blogs)
+        seed_tut4(Tut4, args.authors, args.blogs, rng)
+        failures = 0
+        with TestClient(app) as client:
+            benchmark.seed(args.authors, args.blogs, rng, force=args.force)
+            failures += check(client, ROUTES, database.read_engine, args.verbose)
+        for label, module, routes in (("Tut3", Tut3, TUT3_ROUTES), ("Tut4", Tut4, TUT4_ROUTES)):
+            print(f"-- {label}")
+            with TestClient(module.app) as client:
+                failures += check(client, routes, module.read_engine, args.verbose)
+        for engine in (database.engine, database.read_engine, Tut3.engine, Tut3.read_engine, Tut4.engine, Tut4.read_engine):
+            engine.dispose()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Rate limiting for the login routes, by client IP and by the email tried.
+
+A login attempt costs a bcrypt verify, so a credential-stuffing run is CPU bound.
+RateLimit is a dependency, so an attempt over the limit is answered with a 429 and
+Retry-After before the route looks anything up or hashes anything.
+
+Limits use a sliding window counter: per key only the counts of the current and
+the previous fixed window are kept, and the previous one is weighted by how much
+of it still overlaps the sliding window. That is O(1) memory per key, unlike a log
+of attempt timestamps. The store is pluggable: "memory" (per process, LRU bounded)
+or "redis" (shared by every worker, needs the optional redis package). Backends are
+async, so a Redis round trip never blocks the event loop the dependency runs on.
+"""
+import abc
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from web_common import metrics
+
+from . import config
+
+rejected_total = metrics.register(metrics.Counter(
+    "rate_limited_total", "Requests rejected by a rate limit", ("limiter", "scope")
+))
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """"5/minute" -> (5, 60.0), "100/10second" -> (100, 10.0)."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*", spec)
+    if not match:
+        raise ValueError(f"invalid rate limit {spec!r}, expected e.g. '5/minute'")
+    count, multiplier, period = match.groups()
+    if int(count) < 1:
+        raise ValueError(f"invalid rate limit {spec!r}, the count must be at least 1")
+    return int(count), float(int(multiplier or 1) * PERIODS[period])
+
+def sliding_window(previous: int, current: int, now: float, window: float, limit: int) -> Tuple[bool, float]:
+    """Whether one more hit fits, and if not, the seconds until it would."""
+    elapsed = (now % window) / window
+    if previous * (1 - elapsed) + current + 1 <= limit:
+        return True, 0.0
+    if current + 1 <= limit:
+        # Fits once enough of the previous window has slid out
+        fraction = 1 - (limit - 1 - current) / previous
+        return False, (fraction - elapsed) * window
+    # Not before the next window, and then only once enough of this one has slid out
+    return False, (1 - elapsed) * window + max(0.0, 1 - (limit - 1) / current) * window
+
+class RateLimitBackend(abc.ABC):
+    @abc.abstractmethod
+    async def hit(self, key: str, limit: int, window: float) -> Tuple[bool, float]:
+        """Counts a hit on key if it is within limit per window. Returns
+        (allowed, retry_after seconds), rejected hits are not counted."""
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> [window index, current count, previous count]
+        self._lock = threading.Lock()
+
+    async def hit(self, key, limit, window):
+        # No I/O, the lock is only held for a few dict operations
+        now = time.time()
+        index = int(now // window)
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None:
+                state = self._windows[key] = [index, 0, 0]
+                while len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            elif state[0] != index:
+                state[2] = state[1] if state[0] == index - 1 else 0
+                state[0], state[1] = index, 0
+            self._windows.move_to_end(key)
+            allowed, retry_after = sliding_window(state[2], state[1], now, window, limit)
+            if allowed:
+                state[1] += 1
+            return allowed, retry_after
+
+class RedisBackend(RateLimitBackend):
+    def __init__(self, url: str, prefix: str = "tut5:ratelimit:"):
+        from redis import asyncio as redis
+
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    async def hit(self, key, limit, window):
+        now = time.time()
+        index = int(now // window)
+        current_key = f"{self.prefix}{key}:{index}"
+        previous, current = await self._client.mget(f"{self.prefix}{key}:{index - 1}", current_key)
+        allowed, retry_after = sliding_window(int(previous or 0), int(current or 0), now, window, limit)
+        if allowed:
+            # Two workers may both pass the check above, a limit can be overshot by a hit or two
+            async with self._client.pipeline() as pipe:
+                await pipe.incr(current_key).expire(current_key, math.ceil(2 * window)).execute()
+        return allowed, retry_after
+
+def build_backend() -> RateLimitBackend:
+    if config.RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(config.CACHE_REDIS_URL)
+    return MemoryBackend(config.RATE_LIMIT_MAX_KEYS)
+
+backend = build_backend()
+
+def client_ip(request: Request) -> str:
+    if config.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+class RateLimit:
+    """Dependency limiting a route per client IP and per value of key_field, looked up
+    in the query string and then in a submitted form (email for the login routes,
+    username for the OAuth2 token form)."""
+
+    def __init__(self, name: str, per_ip: Optional[str] = None, per_key: Optional[str] = None,
+                 key_field: str = "email"):
+        self.name = name
+        self.per_ip = parse_limit(per_ip or config.LOGIN_RATE_LIMIT_IP)
+        self.per_key = parse_limit(per_key or config.LOGIN_RATE_LIMIT_EMAIL)
+        self.key_field = key_field
+
+    async def _check(self, scope: str, value: str, limit: Tuple[int, float]):
+        allowed, retry_after = await backend.hit(f"{self.name}:{scope}:{value}", *limit)
+        if not allowed:
+            rejected_total.inc(self.name, scope)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, try again later",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    async def __call__(self, request: Request):
+        await self._check("ip", client_ip(request), self.per_ip)
+        key = request.query_params.get(self.key_field)
+        if key is None and request.headers.get("content-type", "").startswith(
+            ("application/x-www-form-urlencoded", "multipart/form-data")
+        ):
+            key = (await request.form()).get(self.key_field)  # parsed once, the route reuses it
+        if isinstance(key, str) and key:
+            await self._check("key", key.strip().lower(), self.per_key)
@@ -0,0 +1,42 @@
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from .. import models, schemas, database, config
+
+# Aggregates computed server side in one GROUP BY query, or with ANALYTICS_SNAPSHOT=1 from
+# NumPy columns kept in memory (columnar.py), so dashboards polling them do not rescan SQLite
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+if config.ANALYTICS_SNAPSHOT:
+    from .. import columnar
+
+    blog_columns = columnar.ColumnarSnapshot("blogs", ["author_id"], ["int64"])
+
+def blog_counts(db: Session, limit: int):
+    """(author_id, blogs) of the authors with the most blogs."""
+    if config.ANALYTICS_SNAPSHOT:
+        author_ids, counts = columnar.top_counts(blog_columns.refresh(db)["author_id"], limit)
+        return list(zip(author_ids.tolist(), counts.tolist()))
+    blogs = func.count(models.DBBlog.id).label("blogs")
+    return db.execute(
+        select(models.DBBlog.author_id, blogs)
+        .group_by(models.DBBlog.author_id)
+        .order_by(blogs.desc(), models.DBBlog.author_id)
+        .limit(limit)
+    ).all()
+
+# Top Authors by number of Blogs
+@router.get("/blogs-per-author", response_model=List[schemas.AuthorBlogCount])
+def blogs_per_author(limit: int = Query(10, ge=1, le=1000), db: Session = Depends(database.get_db)):
+    counts = blog_counts(db, limit)
+    names = dict(db.execute(
+        select(models.DBAuthor.id, models.DBAuthor.name).where(models.DBAuthor.id.in_([author_id for author_id, _ in counts]))
+    ).all())
+    return [
+        schemas.AuthorBlogCount(author_id=author_id, name=names.get(author_id), blogs=blogs)
+        for author_id, blogs in counts
+    ]
@@ -1,39 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .. import models, schemas, database, hashing
+from .. import models, schemas, database, hashing, queries, cache, ratelimit, compat
 
 router = APIRouter(
     prefix="/authors",
     tags=["Authors"]
 )
 
-# Create an Author
-@router.post("/", response_model=schemas.AuthorResponse)
-def create_author(author: schemas.AuthorCreate, db: Session = Depends(database.get_db)):
-    existing_author = db.query(models.DBAuthor).filter(models.DBAuthor.email == author.email).first()
-    if existing_author:
-        raise HTTPException(status_code=400, detail="Email is already registered")
+# Per client IP and per email, checked before the lookup and the bcrypt verify
+login_limit = ratelimit.RateLimit("authors_login")
 
-    hashed_password = hashing.get_password_hash(author.password)
+def save_author(db: Session, author: schemas.AuthorCreate, hashed_password: str) -> models.DBAuthor:
     db_author = models.DBAuthor(name=author.name, email=author.email, password=hashed_password)
-
     db.add(db_author)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:  # registered by someone else while we were hashing
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email is already registered")
     db.refresh(db_author)
+    cache.invalidate_author(db_author.id)  # drop a cached 404 for the new id
     return db_author
 
-# Get an Author by ID
+# Create an Author
+# The email check uses a read session, it and the insert run in the threadpool, so the
+# event loop never waits on a query and nobody holds the write lock while bcrypt runs
+@router.post("/", response_model=schemas.AuthorResponse)
+async def create_author(
+    author: schemas.AuthorCreate,
+    db: Session = Depends(database.get_db),
+    read_db: Session = Depends(database.get_read_db),
+):
+    if await run_in_threadpool(queries.email_registered, read_db, author.email):
+        raise HTTPException(status_code=400, detail="Email is already registered")
+
+    hashed_password = await hashing.get_password_hash_async(author.password)
+    return await run_in_threadpool(save_author, db, author, hashed_password)
+
+# Get an Author by ID, served from the entity cache
 @router.get("/{author_id}", response_model=schemas.AuthorResponse)
 def get_author(author_id: int, db: Session = Depends(database.get_db)):
-    author = db.query(models.DBAuthor).filter(models.DBAuthor.id == author_id).first()
-    if not author:
+    def load():
+        author = db.query(models.DBAuthor).filter(models.DBAuthor.id == author_id).first()
+        return compat.orm_dict(schemas.AuthorResponse, author) if author else None
+
+    author = cache.entities.get_or_load(cache.author_key(author_id), load)
+    if author is None:
         raise HTTPException(status_code=404, detail="Author not found")
     return author
 
-# Log in Author
-@router.post("/login")
-def login(email: str, password: str, db: Session = Depends(database.get_db)):
-    author = db.query(models.DBAuthor).filter(models.DBAuthor.email == email).first()
-    if not author or not hashing.verify_password(password, author.password):
+def save_password_hash(author_id: int, old_hash: str, new_hash: str):
+    with database.SessionLocal() as db:
+        db.execute(queries.password_rehash_stmt(author_id, old_hash, new_hash))
+        db.commit()
+
+async def rehash_password(author_id: int, password: str, old_hash: str):
+    new_hash = await hashing.rehash_async(password)
+    if new_hash:
+        await run_in_threadpool(save_password_hash, author_id, old_hash, new_hash)
+
+# Log in Author, a lookup only, so it uses a read session and runs in the threadpool.
+# A hash of an older scheme or cost is replaced after the response is sent, the login
+# itself never waits for it
+@router.post("/login", dependencies=[Depends(login_limit)])
+async def login(
+    email: str,
+    password: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_read_db),
+):
+    author = await run_in_threadpool(queries.get_author_by_email, db, email)
+    if not author or not await hashing.verify_password_async(password, author.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if hashing.needs_rehash(author.password):
+        background_tasks.add_task(rehash_password, author.id, password, author.password)
     return {"message": "Login successful!"}
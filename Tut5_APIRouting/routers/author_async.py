@@ -0,0 +1,69 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, database, hashing, queries, cache, ratelimit, compat
+
+# async def versions of the routes in author.py, mounted instead of them when DB_ASYNC is on
+router = APIRouter(
+    prefix="/authors",
+    tags=["Authors"]
+)
+
+login_limit = ratelimit.RateLimit("authors_login")
+
+# Create an Author, the email check uses a read session so the write lock is not held while bcrypt runs
+@router.post("/", response_model=schemas.AuthorResponse)
+async def create_author(
+    author: schemas.AuthorCreate,
+    db: AsyncSession = Depends(database.get_async_db),
+    read_db: AsyncSession = Depends(database.get_async_read_db),
+):
+    if await read_db.scalar(queries.email_registered_stmt(author.email)):
+        raise HTTPException(status_code=400, detail="Email is already registered")
+
+    hashed_password = await hashing.get_password_hash_async(author.password)
+    db_author = models.DBAuthor(name=author.name, email=author.email, password=hashed_password)
+
+    db.add(db_author)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email is already registered")
+    await cache.invalidate_author_async(db_author.id)
+    return db_author
+
+# Get an Author by ID, served from the entity cache
+@router.get("/{author_id}", response_model=schemas.AuthorResponse)
+async def get_author(author_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    async def load():
+        author = await db.scalar(queries.author_stmt(author_id))
+        return compat.orm_dict(schemas.AuthorResponse, author) if author else None
+
+    author = await cache.entities.get_or_load_async(cache.author_key(author_id), load)
+    if author is None:
+        raise HTTPException(status_code=404, detail="Author not found")
+    return author
+
+async def rehash_password(author_id: int, password: str, old_hash: str):
+    new_hash = await hashing.rehash_async(password)
+    if new_hash:
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(queries.password_rehash_stmt(author_id, old_hash, new_hash))
+            await db.commit()
+
+# Log in Author, a lookup only, so it uses a read session. A hash of an older scheme or
+# cost is replaced after the response is sent, the login itself never waits for it
+@router.post("/login", dependencies=[Depends(login_limit)])
+async def login(
+    email: str,
+    password: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(database.get_async_read_db),
+):
+    author = await db.scalar(queries.author_by_email_stmt(email))
+    if not author or not await hashing.verify_password_async(password, author.password):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if hashing.needs_rehash(author.password):
+        background_tasks.add_task(rehash_password, author.id, password, author.password)
+    return {"message": "Login successful!"}
@@ -1,52 +1,150 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
+from typing import List, Literal, Optional
+from .. import config, models, schemas, database, pagination, queries, cache, versions, http_cache, fastjson, write_behind, compat
 
 router = APIRouter(
     prefix="/blogs",
     tags=["Blogs"]
 )
 
-# Create a Blog
-@router.post("/", response_model=schemas.Blogs)
-def create_blog(blog: schemas.Blogs, db: Session = Depends(database.get_db)):
-    author = db.query(models.DBAuthor).filter(models.DBAuthor.id == blog.author_id).first()
-    if not author:
+# Create a Blog, in write-behind mode it is queued and answered with 202 and a write id
+@router.post("/", response_model=schemas.Blogs, responses={202: {"model": schemas.QueuedWrite}})
+def create_blog(
+    blog: schemas.Blogs,
+    db: Session = Depends(database.get_db),
+    read_db: Session = Depends(database.get_read_db),
+):
+    if config.WRITE_BEHIND:
+        # Checked on a read session, so the 202 never waits for the write lock
+        if not queries.author_exists(read_db, blog.author_id):
+            raise HTTPException(status_code=404, detail="Author not found")
+        return write_behind.accepted(write_behind.blog_writes.submit_create(
+            {"name": blog.name, "description": blog.description, "author_id": blog.author_id}
+        ))
+
+    if not queries.author_exists(db, blog.author_id):
         raise HTTPException(status_code=404, detail="Author not found")
-    
+
     db_blog = models.DBBlog(name=blog.name, description=blog.description, author_id=blog.author_id)
     db.add(db_blog)
     db.commit()
     db.refresh(db_blog)
     return db_blog
 
-# Get a Blog by ID
-@router.get("/{blog_id}", response_model=schemas.Blogs)
-def get_blog(blog_id: int, db: Session = Depends(database.get_db)):
-    blog = db.query(models.DBBlog).filter(models.DBBlog.id == blog_id).first()
-    if not blog:
+# Version of a blog's representation, None when the blog does not exist.
+# With the writer included, any author change makes it a new version.
+# Both parts come from the per-process version cache (see cache.cached_version)
+def blog_version(db: Session, blog_id: int, include_writer: bool) -> Optional[str]:
+    version = cache.cached_version(cache.blog_version_key(blog_id), lambda: versions.row_version(db, "blogs", blog_id))
+    if version is not None and include_writer:
+        authors_version = cache.cached_version(cache.AUTHORS_VERSION_KEY, lambda: versions.collection_version(db, "authors"))
+        version = f"{version}.w{authors_version}"
+    return version
+
+def blogs_version(db: Session, include_writer: bool) -> str:
+    version = str(versions.collection_version(db, "blogs"))
+    if include_writer:
+        version = f"{version}.w{versions.collection_version(db, 'authors')}"
+    return version
+
+# Get a Blog by ID, ?include=writer adds the author from the same query
+# A matching If-None-Match gets a 304 from the version alone, otherwise the blog is
+# served from the entity cache. While the version is cached too, neither queries the database
+@router.get("/{blog_id}", response_model=schemas.BlogWithWriter, response_model_exclude_none=True)
+def get_blog(
+    blog_id: int,
+    request: Request,
+    response: Response,
+    include: Optional[Literal["writer"]] = None,
+    db: Session = Depends(database.get_db),
+):
+    include_writer = include == "writer"
+    version = blog_version(db, blog_id, include_writer)
+    if version is None:
         raise HTTPException(status_code=404, detail="Blog not found")
-    return blog
+    etag = http_cache.etag("blog", blog_id, version)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    http_cache.set_headers(response, etag)
+
+    def load():
+        # Same read transaction as a version lookup, so a freshly looked up version matches the body
+        blog = queries.get_blog(db, blog_id, include_writer=include_writer)
+        model = schemas.BlogWithWriter if include_writer else schemas.Blogs
+        return compat.orm_dict(model, blog, exclude_none=True)
+
+    blog = cache.entities.get_or_load(cache.blog_key(blog_id, version), load)
+    # The cached dict was validated when it was loaded
+    return fastjson.json_response(blog, response) if config.FAST_JSON else blog
+
+# Get All Blogs, one keyset page at a time (next page cursor in the X-Next-Cursor header)
+# or, with ?stream=true, every blog after the cursor as NDJSON (limit is ignored)
+# Pages carry a collection ETag that every blog write changes
+@router.get("/", response_model=List[schemas.BlogWithWriter], response_model_exclude_none=True)
+def get_all_blogs(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    include: Optional[Literal["writer"]] = None,
+    db: Session = Depends(database.get_db),
+):
+    after_id = pagination.resolve_after_id(after_id, cursor)
+    etag = http_cache.etag("blogs", blogs_version(db, include_writer=include == "writer" and not stream))
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    if stream:
+        streamed = pagination.ndjson_response(queries.blog_rows_stmt(after_id))
+        http_cache.set_headers(streamed, etag)
+        return streamed
 
-# Get All Blogs
-@router.get("/", response_model=List[schemas.Blogs])
-def get_all_blogs(db: Session = Depends(database.get_db)):
-    blogs_all = db.query(models.DBBlog).all()
-    return blogs_all
+    http_cache.set_headers(response, etag)
+    fast = config.FAST_JSON and include is None
+    if fast:  # plain columns straight to the encoder, no ORM objects and no validation
+        blogs = db.execute(queries.blog_rows_stmt(after_id).limit(limit)).all()
+    else:
+        blogs = queries.list_blogs(db, after_id, limit, include_writer=include == "writer")
+    if len(blogs) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(blogs[-1].id)
+    if fast:
+        return fastjson.rows_response(blogs, response)
+    if include != "writer":
+        return [compat.orm_dict(schemas.Blogs, blog) for blog in blogs]  # the writer is not loaded
+    return blogs
 
 # Get Blogs by Specific Author
 @router.get("/author/{author_id}", response_model=List[schemas.Blogs])
 def get_author_blogs(author_id: int, db: Session = Depends(database.get_db)):
-    author = db.query(models.DBAuthor).filter(models.DBAuthor.id == author_id).first()
+    if config.FAST_JSON:
+        if not queries.author_exists(db, author_id):
+            raise HTTPException(status_code=404, detail="Author not found")
+        return fastjson.rows_response(db.execute(queries.author_blog_rows_stmt(author_id)).all())
+
+    author = queries.get_author_with_blogs(db, author_id)
     if not author:
         raise HTTPException(status_code=404, detail="Author not found")
 
-    return author.writings  # Automatically fetches all blogs for the author
+    return author.writings  # Already loaded by the same query as the author
+
+# Update a Blog, the version triggers give it and the collection a new ETag
+# In write-behind mode it is queued and answered with 202 and a write id
+@router.put("/{blog_id}", response_model=schemas.Blogs, responses={202: {"model": schemas.QueuedWrite}})
+def update_blog(
+    blog_id: int,
+    updated_blog: schemas.Blogs,
+    db: Session = Depends(database.get_db),
+    read_db: Session = Depends(database.get_read_db),
+):
+    if config.WRITE_BEHIND:
+        if not queries.blog_exists(read_db, blog_id):
+            raise HTTPException(status_code=404, detail="Blog not found")
+        return write_behind.accepted(write_behind.blog_writes.submit_update(
+            blog_id, {"name": updated_blog.name, "description": updated_blog.description}
+        ))
 
-# Update a Blog
-@router.put("/{blog_id}", response_model=schemas.Blogs)
-def update_blog(blog_id: int, updated_blog: schemas.Blogs, db: Session = Depends(database.get_db)):
     blog = db.query(models.DBBlog).filter(models.DBBlog.id == blog_id).first()
     if not blog:
         raise HTTPException(status_code=404, detail="Blog not found")
@@ -55,10 +153,11 @@ def update_blog(blog_id: int, updated_blog: schemas.Blogs, db: Session = Depends
     blog.description = updated_blog.description
 
     db.commit()
+    cache.invalidate_blog_versions(blog_id)
     db.refresh(blog)  # Refresh to get updated data from the database
     return blog
 
-# Delete a Blog
+# Delete a Blog, which also changes the collection ETag
 @router.delete("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_blog(blog_id: int, db: Session = Depends(database.get_db)):
     blog = db.query(models.DBBlog).filter(models.DBBlog.id == blog_id).first()
@@ -67,4 +166,13 @@ def delete_blog(blog_id: int, db: Session = Depends(database.get_db)):
 
     db.delete(blog)
     db.commit()
+    cache.invalidate_blog_versions(blog_id)
     return {"detail": "Blog successfully deleted"}
+
+# Outcome of a write queued in write-behind mode, blog_id is set once a create is committed
+@router.get("/writes/{write_id}", response_model=schemas.QueuedWrite)
+def get_write_status(write_id: str):
+    write = write_behind.blog_writes.status(write_id)
+    if write is None:
+        raise HTTPException(status_code=404, detail="Write not found")
+    return write
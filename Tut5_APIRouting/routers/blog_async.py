@@ -0,0 +1,171 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from .. import config, models, schemas, database, pagination, queries, cache, versions, http_cache, fastjson, write_behind, compat
+
+# async def versions of the routes in blog.py, mounted instead of them when DB_ASYNC is on
+router = APIRouter(
+    prefix="/blogs",
+    tags=["Blogs"]
+)
+
+# Create a Blog, queued with a 202 in write-behind mode like the sync route
+@router.post("/", response_model=schemas.Blogs, responses={202: {"model": schemas.QueuedWrite}})
+async def create_blog(
+    blog: schemas.Blogs,
+    db: AsyncSession = Depends(database.get_async_db),
+    read_db: AsyncSession = Depends(database.get_async_read_db),
+):
+    if config.WRITE_BEHIND:
+        if not await read_db.scalar(queries.author_exists_stmt(blog.author_id)):
+            raise HTTPException(status_code=404, detail="Author not found")
+        return write_behind.accepted(write_behind.blog_writes.submit_create(
+            {"name": blog.name, "description": blog.description, "author_id": blog.author_id}
+        ))
+
+    if not await db.scalar(queries.author_exists_stmt(blog.author_id)):
+        raise HTTPException(status_code=404, detail="Author not found")
+
+    db_blog = models.DBBlog(name=blog.name, description=blog.description, author_id=blog.author_id)
+    db.add(db_blog)
+    await db.commit()  # sessions keep their state on commit, so no refresh round-trip
+    return db_blog
+
+async def blog_version(db: AsyncSession, blog_id: int, include_writer: bool) -> Optional[str]:
+    async def row_version():
+        return await db.scalar(versions.row_version_stmt("blogs", blog_id))
+
+    async def authors_version():
+        return await db.scalar(versions.collection_version_stmt("authors"))
+
+    version = await cache.cached_version_async(cache.blog_version_key(blog_id), row_version)
+    if version is not None and include_writer:
+        version = f"{version}.w{await cache.cached_version_async(cache.AUTHORS_VERSION_KEY, authors_version)}"
+    return version
+
+async def blogs_version(db: AsyncSession, include_writer: bool) -> str:
+    version = str(await db.scalar(versions.collection_version_stmt("blogs")))
+    if include_writer:
+        version = f"{version}.w{await db.scalar(versions.collection_version_stmt('authors'))}"
+    return version
+
+# Get a Blog by ID, ?include=writer adds the author from the same query
+@router.get("/{blog_id}", response_model=schemas.BlogWithWriter, response_model_exclude_none=True)
+async def get_blog(
+    blog_id: int,
+    request: Request,
+    response: Response,
+    include: Optional[Literal["writer"]] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    include_writer = include == "writer"
+    version = await blog_version(db, blog_id, include_writer)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Blog not found")
+    etag = http_cache.etag("blog", blog_id, version)
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    http_cache.set_headers(response, etag)
+
+    async def load():
+        blog = (await db.execute(queries.blog_stmt(blog_id, include_writer))).scalars().first()
+        model = schemas.BlogWithWriter if include_writer else schemas.Blogs
+        return compat.orm_dict(model, blog, exclude_none=True)
+
+    blog = await cache.entities.get_or_load_async(cache.blog_key(blog_id, version), load)
+    return fastjson.json_response(blog, response) if config.FAST_JSON else blog
+
+# Get All Blogs, keyset paginated or streamed as NDJSON like the sync route
+@router.get("/", response_model=List[schemas.BlogWithWriter], response_model_exclude_none=True)
+async def get_all_blogs(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    include: Optional[Literal["writer"]] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    after_id = pagination.resolve_after_id(after_id, cursor)
+    etag = http_cache.etag("blogs", await blogs_version(db, include_writer=include == "writer" and not stream))
+    if http_cache.is_fresh(request, etag):
+        return http_cache.not_modified(etag)
+    if stream:
+        streamed = pagination.ndjson_response_async(queries.blog_rows_stmt(after_id))
+        http_cache.set_headers(streamed, etag)
+        return streamed
+
+    http_cache.set_headers(response, etag)
+    fast = config.FAST_JSON and include is None
+    if fast:
+        blogs = (await db.execute(queries.blog_rows_stmt(after_id).limit(limit))).all()
+    else:
+        blogs = (await db.execute(queries.blog_page_stmt(after_id, limit, include_writer=include == "writer"))).scalars().all()
+    if len(blogs) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(blogs[-1].id)
+    if fast:
+        return fastjson.rows_response(blogs, response)
+    if include != "writer":
+        return [compat.orm_dict(schemas.Blogs, blog) for blog in blogs]  # the writer is not loaded
+    return blogs
+
+# Get Blogs by Specific Author
+@router.get("/author/{author_id}", response_model=List[schemas.Blogs])
+async def get_author_blogs(author_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    if config.FAST_JSON:
+        if not await db.scalar(queries.author_exists_stmt(author_id)):
+            raise HTTPException(status_code=404, detail="Author not found")
+        return fastjson.rows_response((await db.execute(queries.author_blog_rows_stmt(author_id))).all())
+
+    author = (await db.execute(queries.author_with_blogs_stmt(author_id))).unique().scalars().first()
+    if not author:
+        raise HTTPException(status_code=404, detail="Author not found")
+
+    return author.writings
+
+# Update a Blog, queued with a 202 in write-behind mode like the sync route
+@router.put("/{blog_id}", response_model=schemas.Blogs, responses={202: {"model": schemas.QueuedWrite}})
+async def update_blog(
+    blog_id: int,
+    updated_blog: schemas.Blogs,
+    db: AsyncSession = Depends(database.get_async_db),
+    read_db: AsyncSession = Depends(database.get_async_read_db),
+):
+    if config.WRITE_BEHIND:
+        if not await read_db.scalar(queries.blog_exists_stmt(blog_id)):
+            raise HTTPException(status_code=404, detail="Blog not found")
+        return write_behind.accepted(write_behind.blog_writes.submit_update(
+            blog_id, {"name": updated_blog.name, "description": updated_blog.description}
+        ))
+
+    blog = await db.get(models.DBBlog, blog_id)
+    if not blog:
+        raise HTTPException(status_code=404, detail="Blog not found")
+
+    blog.name = updated_blog.name
+    blog.description = updated_blog.description
+
+    await db.commit()
+    cache.invalidate_blog_versions(blog_id)
+    return blog
+
+# Delete a Blog
+@router.delete("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_blog(blog_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    blog = await db.get(models.DBBlog, blog_id)
+    if not blog:
+        raise HTTPException(status_code=404, detail="Blog not found")
+
+    await db.delete(blog)
+    await db.commit()
+    cache.invalidate_blog_versions(blog_id)
+    return {"detail": "Blog successfully deleted"}
+
+# Outcome of a write queued in write-behind mode
+@router.get("/writes/{write_id}", response_model=schemas.QueuedWrite)
+async def get_write_status(write_id: str):
+    write = write_behind.blog_writes.status(write_id)
+    if write is None:
+        raise HTTPException(status_code=404, detail="Write not found")
+    return write
@@ -0,0 +1,185 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .. import models, schemas, database, hashing, cache, config, queries, compat
+
+# Batch writes for ingestion jobs: every item is validated with one set query, the valid
+# ones are written with a single executemany and one commit, and the invalid ones are
+# reported in BulkResult.errors instead of failing the whole batch.
+# main.py registers this router before blog/author so "bulk" is never parsed as an id.
+router = APIRouter()
+
+def _check_size(items: list):
+    if len(items) > config.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.BULK_MAX_ITEMS} items per request",
+        )
+
+def _delete_ids(db: Session, model, ids):
+    for chunk in queries.in_chunks(ids):
+        db.execute(delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False))
+
+# Create Blogs
+@router.post("/blogs/bulk", response_model=schemas.BulkResult, tags=["Blogs"])
+def create_blogs(blogs: List[schemas.BlogCreate], db: Session = Depends(database.get_db)):
+    _check_size(blogs)
+    known_authors = queries.existing(db, models.DBAuthor.id, (blog.author_id for blog in blogs))
+
+    rows, errors = [], []
+    for index, blog in enumerate(blogs):
+        if blog.author_id not in known_authors:
+            errors.append(schemas.BulkItemError(index=index, detail="Author not found"))
+        else:
+            rows.append(compat.to_dict(blog))
+
+    ids = []
+    if rows:
+        # SQLite hands out rowids in insertion order, so sorting the RETURNING ids gives request
+        # order without sort_by_parameter_order, which would fall back to one INSERT per row
+        ids = sorted(db.execute(insert(models.DBBlog).returning(models.DBBlog.id), rows).scalars())
+        db.commit()
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+# Update Blogs, only the fields sent for an item are changed
+@router.patch("/blogs/bulk", response_model=schemas.BulkResult, tags=["Blogs"])
+def update_blogs(blogs: List[schemas.BlogPatch], db: Session = Depends(database.get_db)):
+    _check_size(blogs)
+    known_blogs = queries.existing(db, models.DBBlog.id, (blog.id for blog in blogs))
+
+    ids, rows, errors = [], [], []
+    for index, blog in enumerate(blogs):
+        if blog.id not in known_blogs:
+            errors.append(schemas.BulkItemError(index=index, detail="Blog not found"))
+            continue
+        ids.append(blog.id)
+        values = compat.to_dict(blog, exclude_none=True)
+        if len(values) > 1:
+            rows.append(values)
+
+    if rows:
+        db.execute(update(models.DBBlog), rows)
+        db.commit()
+        cache.invalidate_blog_versions(*ids)
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+# Delete Blogs
+@router.delete("/blogs/bulk", response_model=schemas.BulkResult, tags=["Blogs"])
+def delete_blogs(request: schemas.BulkDelete, db: Session = Depends(database.get_db)):
+    _check_size(request.ids)
+    known_blogs = queries.existing(db, models.DBBlog.id, request.ids)
+
+    ids, errors = [], []
+    for index, blog_id in enumerate(request.ids):
+        if blog_id not in known_blogs:
+            errors.append(schemas.BulkItemError(index=index, detail="Blog not found"))
+        else:
+            ids.append(blog_id)
+
+    if ids:
+        _delete_ids(db, models.DBBlog, ids)
+        db.commit()
+        cache.invalidate_blog_versions(*ids)
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+def _insert_authors(db: Session, rows) -> dict:
+    # An email registered while we were hashing is skipped by ON CONFLICT instead of failing the batch
+    stmt = sqlite_insert(models.DBAuthor).on_conflict_do_nothing(index_elements=["email"])
+    inserted = dict(db.execute(stmt.returning(models.DBAuthor.email, models.DBAuthor.id), rows).all())
+    db.commit()
+    return inserted
+
+# Create Authors
+# Emails are checked on a read session, the check and the insert run in the threadpool,
+# so the write lock is not held while bcrypt runs and no query blocks the event loop
+@router.post("/authors/bulk", response_model=schemas.BulkResult, tags=["Authors"])
+async def create_authors(
+    authors: List[schemas.AuthorCreate],
+    db: Session = Depends(database.get_db),
+    read_db: Session = Depends(database.get_read_db),
+):
+    _check_size(authors)
+    registered = await run_in_threadpool(queries.existing, read_db, models.DBAuthor.email, [author.email for author in authors])
+
+    accepted, errors = [], []
+    for index, author in enumerate(authors):
+        if author.email in registered:
+            errors.append(schemas.BulkItemError(index=index, detail="Email is already registered"))
+        else:
+            registered.add(author.email)
+            accepted.append((index, author))
+
+    hashes = await hashing.get_password_hashes_async([author.password for _, author in accepted])
+    rows = [
+        {"name": author.name, "email": author.email, "password": hashed}
+        for (_, author), hashed in zip(accepted, hashes)
+    ]
+
+    ids = []
+    if rows:
+        inserted = await run_in_threadpool(_insert_authors, db, rows)
+        for index, author in accepted:
+            if author.email in inserted:
+                ids.append(inserted[author.email])
+                cache.invalidate_author(inserted[author.email])
+            else:
+                errors.append(schemas.BulkItemError(index=index, detail="Email is already registered"))
+        errors.sort(key=lambda error: error.index)
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+# Update Authors, only the fields sent for an item are changed
+@router.patch("/authors/bulk", response_model=schemas.BulkResult, tags=["Authors"])
+def update_authors(authors: List[schemas.AuthorPatch], db: Session = Depends(database.get_db)):
+    _check_size(authors)
+    known_authors = queries.existing(db, models.DBAuthor.id, (author.id for author in authors))
+    email_owners = {}
+    for chunk in queries.in_chunks(author.email for author in authors if author.email):
+        email_owners.update(db.execute(
+            select(models.DBAuthor.email, models.DBAuthor.id).where(models.DBAuthor.email.in_(chunk))
+        ).all())
+
+    ids, rows, errors = [], [], []
+    for index, author in enumerate(authors):
+        if author.id not in known_authors:
+            errors.append(schemas.BulkItemError(index=index, detail="Author not found"))
+            continue
+        if author.email and email_owners.setdefault(author.email, author.id) != author.id:
+            errors.append(schemas.BulkItemError(index=index, detail="Email is already registered"))
+            continue
+        ids.append(author.id)
+        values = compat.to_dict(author, exclude_none=True)
+        if len(values) > 1:
+            rows.append(values)
+
+    if rows:
+        db.execute(update(models.DBAuthor), rows)
+        db.commit()
+        for author_id in ids:
+            cache.invalidate_author(author_id)
+    return schemas.BulkResult(ids=ids, errors=errors)
+
+# Delete Authors, authors that still have blogs are reported and kept
+@router.delete("/authors/bulk", response_model=schemas.BulkResult, tags=["Authors"])
+def delete_authors(request: schemas.BulkDelete, db: Session = Depends(database.get_db)):
+    _check_size(request.ids)
+    known_authors = queries.existing(db, models.DBAuthor.id, request.ids)
+    with_blogs = queries.existing(db, models.DBBlog.author_id, request.ids)
+
+    ids, errors = [], []
+    for index, author_id in enumerate(request.ids):
+        if author_id not in known_authors:
+            errors.append(schemas.BulkItemError(index=index, detail="Author not found"))
+        elif author_id in with_blogs:
+            errors.append(schemas.BulkItemError(index=index, detail="Author still has blogs"))
+        else:
+            ids.append(author_id)
+
+    if ids:
+        _delete_ids(db, models.DBAuthor, ids)
+        db.commit()
+        for author_id in ids:
+            cache.invalidate_author(author_id)
+    return schemas.BulkResult(ids=ids, errors=errors)
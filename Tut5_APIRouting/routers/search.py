@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import schemas, database, pagination, search
+
+# Registered before the blog router so "search" is not parsed as a blog id
+router = APIRouter(
+    prefix="/blogs",
+    tags=["Blogs"]
+)
+
+# Search Blogs by name and description, best matches first. Words ending in * match
+# prefixes; the next page cursor is in the X-Next-Cursor header.
+@router.get("/search", response_model=List[schemas.BlogSearchHit])
+def search_blogs(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_db),
+):
+    after_rank, after_id = pagination.decode_rank_cursor(cursor) if cursor else (float("-inf"), 0)
+    try:
+        hits = search.search_blogs(db, q, limit, after_rank, after_id)
+    except OperationalError as exc:
+        if "no such table: blogs_fts" not in str(exc):
+            raise
+        raise HTTPException(status_code=503, detail="Search index missing, run python -m Tut5_APIRouting.search")
+
+    if len(hits) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_rank_cursor(hits[-1]["rank"], hits[-1]["id"])
+    return hits
@@ -0,0 +1,38 @@
+from typing import List, Literal
+from fastapi import APIRouter, Query, Request
+from sqlalchemy import insert
+from .. import models, schemas, database, queries, tabular
+
+# Whole-table CSV/Parquet export and import, see tabular.py.
+# main.py registers this router before blog so "export" and "import" are not parsed as ids.
+router = APIRouter(
+    prefix="/blogs",
+    tags=["Blogs"]
+)
+
+# Export every Blog, streamed from a server-side cursor a batch at a time
+@router.get("/export")
+def export_blogs(fmt: Literal["csv", "parquet"] = Query("csv", alias="format")):
+    return tabular.export_response(database.ReadSessionLocal, queries.blog_rows_stmt(0), fmt, "blogs")
+
+def insert_blogs(rows: List[dict]):
+    # The author check and the insert share one write transaction
+    with database.SessionLocal() as db:
+        known_authors = queries.existing(db, models.DBAuthor.id, (row["author_id"] for row in rows))
+
+        accepted, rejected = [], []
+        for position, row in enumerate(rows):
+            if row["author_id"] in known_authors:
+                accepted.append(row)
+            else:
+                rejected.append((position, "Author not found"))
+        if accepted:
+            db.execute(insert(models.DBBlog), accepted)
+            db.commit()
+    return rejected
+
+# Import Blogs from a CSV or Parquet request body with name, description and author_id
+# columns (an id column is ignored, blogs get new ids), committed a batch at a time
+@router.post("/import", response_model=schemas.ImportResult)
+async def import_blogs(request: Request, fmt: Literal["csv", "parquet"] = Query("csv", alias="format")):
+    return await tabular.import_upload(request, fmt, "blogs", schemas.BlogCreate, insert_blogs)
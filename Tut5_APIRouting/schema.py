@@ -0,0 +1,59 @@
+"""Schema setup for the Tut5 database, run by the app's lifespan instead of at import.
+
+create_all looks every table up in sqlite_master and the version triggers are checked
+table by table, a round trip each on every worker boot. Once a database is set up its
+PRAGMA user_version holds SCHEMA_VERSION, and startup costs a single pragma read.
+Bump SCHEMA_VERSION whenever models.py, search.FTS_DDL or the version triggers change,
+so existing databases are brought up to date on their next start.
+
+create_all only creates the indexes of the tables it creates, so the indexes declared
+on the models are also added to existing tables here (see indexes.py, version 2 added
+blogs.author_id and authors.email). Likewise the after_create hook in search.py only
+installs the search index with a new blogs table, so ensure() installs and backfills
+it for an existing one (version 3, for databases marked 2 without it). To upgrade a Tut5 database without
+starting the app:
+
+    python -m Tut5_APIRouting.schema     # set up DATABASE_URL ahead of a deploy
+    python -m Tut5_APIRouting.schema sqlite:///./sample.db
+
+Only point it at Tut5 databases, as it installs the search index and version triggers.
+Tut3 and Tut4 add their own missing indexes at startup (indexes.add_missing_indexes).
+"""
+import argparse
+
+from . import models, search, versions
+from .indexes import add_missing_indexes
+from .config import DATABASE_URL
+from .database import create_sqlite_engine, engine
+
+SCHEMA_VERSION = 3
+VERSIONED_TABLES = ("authors", "blogs")
+
+def current_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def ensure(bind=engine) -> bool:
+    """Creates missing tables, the search index and the version triggers unless the
+    database is already at SCHEMA_VERSION. Returns whether anything had to be done.
+    Runs under BEGIN IMMEDIATE, so workers starting together do it one at a time."""
+    with bind.begin() as connection:
+        if current_version(connection) == SCHEMA_VERSION:
+            return False
+        models.Base.metadata.create_all(bind=connection)
+        add_missing_indexes(connection, models.Base.metadata)
+        # A blogs table from before the search index has no blogs_fts yet
+        if not search.installed(connection):
+            search.backfill(connection)
+        # Row and collection versions behind the blog ETags, backfilled for existing rows
+        for table in VERSIONED_TABLES:
+            versions.ensure(connection, table)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or upgrade the schema of Tut5 databases")
+    parser.add_argument("urls", nargs="*", help=f"database URLs (default: {DATABASE_URL})")
+    for url in parser.parse_args().urls or [DATABASE_URL]:
+        bind = engine if url == DATABASE_URL else create_sqlite_engine(url)
+        done = ensure(bind)
+        print(f"{url}: " + (f"upgraded to version {SCHEMA_VERSION}" if done else f"already at version {SCHEMA_VERSION}"))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 
 class Blogs(BaseModel):
     id: int
@@ -22,3 +22,64 @@ class AuthorResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+# Blog read with ?include=writer, the author comes from the same query as the blog
+class BlogWithWriter(Blogs):
+    writer: Optional[AuthorResponse] = None
+
+# Bulk endpoints
+class BlogCreate(BaseModel):
+    name: str
+    description: str
+    author_id: int
+
+class BlogPatch(BaseModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+
+class AuthorPatch(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+
+class BulkDelete(BaseModel):
+    ids: List[int]
+
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+# ids of the items that were written, in request order, and why the others were skipped
+class BulkResult(BaseModel):
+    ids: List[int]
+    errors: List[BulkItemError]
+
+# Outcome of a CSV/Parquet import: rows written, the rejected ones by row number (1 is the
+# first data row) and the throughput
+class ImportResult(BaseModel):
+    rows: int
+    error_count: int
+    errors: List[BulkItemError]
+    bytes: int
+    seconds: float
+    rows_per_second: float
+
+# GET /analytics/blogs-per-author, name is None for blogs whose author no longer exists
+class AuthorBlogCount(BaseModel):
+    author_id: int
+    name: Optional[str] = None
+    blogs: int
+
+# GET /blogs/search hit, highlights wrap matched terms in <mark></mark>
+class BlogSearchHit(Blogs):
+    rank: float
+    name_highlight: str
+    snippet: str
+
+# 202 answer of the write-behind routes and GET /blogs/writes/{write_id}
+class QueuedWrite(BaseModel):
+    write_id: str
+    status: Literal["queued", "committed", "failed"]
+    blog_id: Optional[int] = None
+    detail: Optional[str] = None
@@ -0,0 +1,92 @@
+"""Full-text index over blog names and descriptions (SQLite FTS5).
+
+blogs_fts is an external-content FTS5 table over blogs, kept in sync by triggers
+so every write path (single routes, bulk executemany, raw SQL) updates it.
+New databases get it from create_all; schema.ensure() installs and backfills it on
+existing ones, and it can be rebuilt by hand with:
+
+    python -m Tut5_APIRouting.search
+"""
+import argparse
+import re
+
+from sqlalchemy import event, text
+
+from . import models
+
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blogs_fts USING fts5(
+        name, description, content='blogs', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS blogs_fts_ai AFTER INSERT ON blogs BEGIN
+        INSERT INTO blogs_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blogs_fts_ad AFTER DELETE ON blogs BEGIN
+        INSERT INTO blogs_fts(blogs_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blogs_fts_au AFTER UPDATE OF name, description ON blogs BEGIN
+        INSERT INTO blogs_fts(blogs_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO blogs_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+# Hits ordered by bm25 (lower is better) then id, resuming after the (rank, id) of the cursor
+SEARCH_SQL = text("""
+    SELECT * FROM (
+        SELECT blogs.id, blogs.name, blogs.description, blogs.author_id,
+               bm25(blogs_fts) AS rank,
+               highlight(blogs_fts, 0, :open, :close) AS name_highlight,
+               snippet(blogs_fts, 1, :open, :close, '…', :snippet_tokens) AS snippet
+        FROM blogs_fts JOIN blogs ON blogs.id = blogs_fts.rowid
+        WHERE blogs_fts MATCH :query
+    )
+    WHERE rank > :after_rank OR (rank = :after_rank AND id > :after_id)
+    ORDER BY rank, id
+    LIMIT :limit
+""")
+
+SNIPPET_TOKENS = 12
+
+def install(connection):
+    for ddl in FTS_DDL:
+        connection.exec_driver_sql(ddl)
+
+def installed(connection) -> bool:
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blogs_fts'"
+    ).first() is not None
+
+def backfill(connection):
+    install(connection)
+    connection.exec_driver_sql("INSERT INTO blogs_fts(blogs_fts) VALUES ('rebuild')")
+
+@event.listens_for(models.DBBlog.__table__, "after_create")
+def _install_on_create(target, connection, **kw):
+    install(connection)
+
+def to_match_query(q: str) -> str:
+    """Turns free text into an FTS5 query: every word must match, and words
+    ending in * match as prefixes ("pand*" finds "pandas"). Quoting each term keeps
+    FTS5 operators and punctuation in user input from being parsed as syntax."""
+    terms = re.findall(r"\w+\*?", q)
+    return " ".join(f'"{term.rstrip("*")}"' + ("*" if term.endswith("*") else "") for term in terms)
+
+def search_blogs(db, q: str, limit: int, after_rank: float = float("-inf"), after_id: int = 0,
+                 open_tag: str = "<mark>", close_tag: str = "</mark>"):
+    query = to_match_query(q)
+    if not query:
+        return []
+    return db.execute(SEARCH_SQL, {
+        "query": query, "limit": limit, "after_rank": after_rank, "after_id": after_id,
+        "open": open_tag, "close": close_tag, "snippet_tokens": SNIPPET_TOKENS,
+    }).mappings().all()
+
+if __name__ == "__main__":
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Create the blogs_fts index and (re)build it from the blogs table")
+    parser.parse_args()
+    with engine.begin() as connection:
+        backfill(connection)
+        indexed = connection.exec_driver_sql("SELECT count(*) FROM blogs_fts").scalar()
+    print(f"blogs_fts rebuilt, {indexed} blogs indexed")
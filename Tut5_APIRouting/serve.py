@@ -0,0 +1,402 @@
+"""Pre-fork launcher: one listening socket shared by N uvicorn worker processes.
+
+    python -m Tut5_APIRouting.serve --port 8000 [--workers 8] [--health-port 8001]
+    python -m Tut5_APIRouting.serve --app fastapi_app.main:app --port 8000
+
+The parent imports the app and loads the uvicorn configuration once, so route
+modules, compiled templates, the bcrypt cost calibration and engine configuration are
+in memory before it forks, shared copy-on-write by every worker. For the Tut5 app it
+also brings the schema up to date. Each worker resets the engine pools it inherited,
+so no SQLite connection is used by two processes.
+
+A worker is replaced when it exits. Workers exit after --max-requests requests (plus up
+to --max-requests-jitter, so they do not all recycle at once) to bound their memory,
+and are killed when their heartbeat is older than --worker-timeout. The heartbeat is
+written from the worker's event loop, so a blocked loop shows up as a stale heartbeat.
+
+A worker that crashes (exits with an error or is killed) is replaced after a backoff
+that starts at --respawn-backoff and doubles with every crash of its slot in a row, up
+to --respawn-backoff-max, so a worker failing at startup does not fork in a tight loop.
+A worker that ran for CRASH_RESET_SECONDS resets its slot's count. After --max-crashes
+crashes in a row the launcher stops the other workers and exits with status 1.
+
+SIGHUP reloads gracefully. The parent checks that the new code imports and
+re-executes itself with the sockets still open. It then starts new workers and, once
+they are ready, sends SIGTERM to the old ones, which stop accepting and finish their
+in-flight requests within --graceful-timeout. SIGTERM or SIGINT stops everything the
+same way.
+
+--health-port serves the state of every worker as JSON: pid, uptime, requests served
+and heartbeat age. It answers 503 when a worker is not healthy.
+
+State kept in process memory is per worker: the "memory" entity cache, the rate limit
+stores, write-behind queues and /metrics. Use the redis backends to share the caches
+and rate limits. The launcher is POSIX only; on Windows run uvicorn --workers instead.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import mmap
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+# Workers inherit the routers from the parent, loading them lazily would import them in every worker
+os.environ["LAZY_ROUTERS"] = "0"
+
+import uvicorn  # noqa: E402
+
+from . import config  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 1.0
+# A crash after this long up is not part of a crash loop
+CRASH_RESET_SECONDS = 60.0
+# Set across the re-exec of a reload: the inherited socket fds and the workers left to drain
+SOCKETS_ENV = "TUT5_SERVE_SOCKETS"
+DRAIN_ENV = "TUT5_SERVE_DRAIN"
+
+class Slots:
+    """Per worker state in an anonymous shared mapping, written by the workers and read by
+    the parent. Every field has its own offset, so writers never overwrite each other."""
+
+    FIELDS = {"pid": "q", "started": "d", "ready": "d", "heartbeat": "d", "requests": "q"}
+
+    def __init__(self, count: int):
+        self._fields = {}
+        offset = 0
+        for name, code in self.FIELDS.items():
+            self._fields[name] = (struct.Struct(f"={code}"), offset)
+            offset += struct.calcsize(f"={code}")
+        self._size = offset
+        self._map = mmap.mmap(-1, self._size * count)
+
+    def set(self, index: int, **values):
+        for name, value in values.items():
+            field, offset = self._fields[name]
+            field.pack_into(self._map, index * self._size + offset, value)
+
+    def read(self, index: int) -> dict:
+        return {
+            name: field.unpack_from(self._map, index * self._size + offset)[0]
+            for name, (field, offset) in self._fields.items()
+        }
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def load_app(path: str):
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "app")
+
+def _database():
+    return sys.modules.get(f"{__package__}.database")
+
+def warm(app_path: str):
+    app = load_app(app_path)
+    database = _database()
+    if database is not None:
+        from . import schema
+
+        schema.ensure()
+        database.engine.dispose()  # the workers open their own connections
+    return app
+
+def _reset_engines():
+    database = _database()
+    if database is None:
+        return
+    engines = [database.engine, database.read_engine]
+    if config.DB_ASYNC:
+        engines += [database.async_engine.sync_engine, database.async_read_engine.sync_engine]
+    for engine in engines:
+        engine.dispose(close=False)  # forget the parent's pooled connections without closing them
+
+async def _heartbeat(server: uvicorn.Server, slots: Slots, index: int):
+    ready = False
+    while True:
+        if server.started and not ready:
+            slots.set(index, ready=time.time())
+            ready = True
+        slots.set(index, heartbeat=time.time(), requests=server.server_state.total_requests)
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+async def _serve(server: uvicorn.Server, sock: socket.socket, slots: Slots, index: int):
+    heartbeat = asyncio.ensure_future(_heartbeat(server, slots, index))
+    try:
+        await server.serve(sockets=[sock])
+    finally:
+        heartbeat.cancel()
+
+def _kill(pid: int, sig: int):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+class Arbiter:
+    def __init__(self, args):
+        self.args = args
+        inherited = os.environ.pop(SOCKETS_ENV, "")
+        if inherited:
+            fds = [int(fd) for fd in inherited.split(",")]
+            self.sock = socket.socket(fileno=fds[0])
+            self.health_sock = socket.socket(fileno=fds[1]) if len(fds) > 1 else None
+        else:
+            self.sock = listen(args.host, args.port)
+            self.health_sock = listen(args.host, args.health_port, backlog=16) if args.health_port else None
+        self.draining = {int(pid) for pid in os.environ.pop(DRAIN_ENV, "").split(",") if pid}
+        self.drain_started = None
+
+        self.uvicorn_config = uvicorn.Config(
+            warm(args.app),
+            lifespan="on",
+            timeout_graceful_shutdown=args.graceful_timeout,
+            log_level=args.log_level,
+        )
+        self.uvicorn_config.load()  # protocol and loop imports, done once here
+        self.slots = Slots(args.workers)
+        self.workers = {}  # pid -> slot index
+        self.crashes = {}  # slot index -> crashes in a row
+        self.respawn_at = {}  # slot index -> time a crashed worker is replaced
+        self.exit_code = 0
+        self.signals = []
+        self.running = True
+        self.started = time.time()
+        self.deadline = None
+
+    def spawn(self, index: int):
+        now = time.time()
+        self.slots.set(index, pid=0, started=now, ready=0.0, heartbeat=now, requests=0)
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)
+        self.slots.set(index, pid=pid)
+        self.workers[pid] = index
+
+    def _run_worker(self, index: int):
+        code = 0
+        try:
+            for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_IGN)  # uvicorn installs its own while serving
+            if self.health_sock is not None:
+                self.health_sock.close()
+            _reset_engines()
+            if self.args.max_requests:
+                jitter = int.from_bytes(os.urandom(4), "big") % (self.args.max_requests_jitter + 1)
+                self.uvicorn_config.limit_max_requests = self.args.max_requests + jitter
+            server = uvicorn.Server(self.uvicorn_config)
+            asyncio.run(_serve(server, self.sock, self.slots, index))
+            if not server.started:
+                code = 3  # the lifespan startup failed, uvicorn.run exits with 3 for it too
+        except SystemExit as exc:
+            code = exc.code if isinstance(exc.code, int) else 1
+        except BaseException:
+            logger.exception("worker %d failed", os.getpid())
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _on_signal(self, sig, frame):
+        self.signals.append(sig)
+
+    def run(self) -> int:
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_signal)
+        for index in range(self.args.workers):
+            self.spawn(index)
+        logger.info("serving %s on %s:%d with %d workers", self.args.app, self.args.host, self.args.port, len(self.workers))
+
+        selector = selectors.DefaultSelector()
+        if self.health_sock is not None:
+            self.health_sock.setblocking(False)
+            selector.register(self.health_sock, selectors.EVENT_READ)
+        while self.running or self.workers or self.draining:
+            for _ in selector.select(timeout=0.5):
+                self._answer_health()
+            self._reap()
+            self._handle_signals()
+            if self.running:
+                self._respawn_due()
+                self._check_heartbeats()
+                self._drain_old_workers()
+            elif time.time() > self.deadline:
+                for pid in list(self.workers) + list(self.draining):
+                    _kill(pid, signal.SIGKILL)
+        return self.exit_code
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.draining.discard(pid)
+            index = self.workers.pop(pid, None)
+            if index is not None and self.running:
+                self._replace(index, pid, os.waitstatus_to_exitcode(status))
+
+    def _replace(self, index: int, pid: int, code: int):
+        if code == 0:  # recycled after --max-requests or stopped cleanly
+            logger.info("worker %d exited, starting a new one", pid)
+            self.crashes[index] = 0
+            self.spawn(index)
+            return
+        if time.time() - self.slots.read(index)["started"] >= CRASH_RESET_SECONDS:
+            self.crashes[index] = 0
+        self.crashes[index] = crashes = self.crashes.get(index, 0) + 1
+        if self.args.max_crashes and crashes >= self.args.max_crashes:
+            logger.error("worker %d exited with status %d, %d crashes in a row, giving up", pid, code, crashes)
+            self.exit_code = 1
+            self.stop()
+            return
+        delay = min(self.args.respawn_backoff_max, self.args.respawn_backoff * 2 ** (crashes - 1))
+        logger.warning("worker %d exited with status %d, starting a new one in %.1fs", pid, code, delay)
+        self.respawn_at[index] = time.time() + delay
+
+    def _respawn_due(self):
+        now = time.time()
+        for index, due in list(self.respawn_at.items()):
+            if due <= now:
+                del self.respawn_at[index]
+                self.spawn(index)
+
+    def _handle_signals(self):
+        while self.signals:
+            sig = self.signals.pop(0)
+            if sig == signal.SIGHUP and self.running:
+                self.reload()
+            elif self.running:
+                self.stop()
+            else:  # a second SIGINT/SIGTERM does not wait for the drain
+                self.deadline = 0
+
+    def _check_heartbeats(self):
+        now = time.time()
+        for pid, index in list(self.workers.items()):
+            stale = now - self.slots.read(index)["heartbeat"]
+            if stale > self.args.worker_timeout:
+                logger.warning("worker %d missed its heartbeat for %.0fs, killing it", pid, stale)
+                _kill(pid, signal.SIGKILL)  # reaped and replaced on the next pass
+
+    def _drain_old_workers(self):
+        """After a reload, stops the previous workers once the new ones are ready."""
+        if not self.draining:
+            return
+        now = time.time()
+        if self.drain_started is None:
+            ready = all(self.slots.read(index)["ready"] for index in self.workers.values())
+            if ready or now - self.started > self.args.graceful_timeout:
+                logger.info("draining %d workers of the previous code", len(self.draining))
+                for pid in self.draining:
+                    _kill(pid, signal.SIGTERM)
+                self.drain_started = now
+        elif now - self.drain_started > self.args.graceful_timeout + 5:
+            for pid in self.draining:
+                _kill(pid, signal.SIGKILL)
+
+    def stop(self):
+        logger.info("shutting down, draining %d workers", len(self.workers) + len(self.draining))
+        self.running = False
+        self.deadline = time.time() + self.args.graceful_timeout + 5
+        for pid in list(self.workers) + list(self.draining):
+            _kill(pid, signal.SIGTERM)
+
+    def reload(self):
+        module = self.args.app.partition(":")[0]
+        if subprocess.run([sys.executable, "-c", f"import {module}"]).returncode != 0:
+            logger.error("not reloading, %s does not import", module)
+            return
+        logger.info("reloading")
+        sockets = [self.sock] + ([self.health_sock] if self.health_sock is not None else [])
+        for sock in sockets:
+            sock.set_inheritable(True)
+        os.environ[SOCKETS_ENV] = ",".join(str(sock.fileno()) for sock in sockets)
+        os.environ[DRAIN_ENV] = ",".join(str(pid) for pid in list(self.workers) + list(self.draining))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Same pid, so the running workers stay our children and are drained by the new image
+        os.execv(sys.executable, [sys.executable, "-m", f"{__package__}.serve", *sys.argv[1:]])
+
+    def health(self):
+        now = time.time()
+        workers = []
+        for pid, index in sorted(self.workers.items(), key=lambda item: item[1]):
+            slot = self.slots.read(index)
+            heartbeat_age = now - slot["heartbeat"]
+            workers.append({
+                "index": index,
+                "pid": pid,
+                "uptime_s": round(now - slot["started"], 1),
+                "ready": slot["ready"] > 0,
+                "requests": slot["requests"],
+                "heartbeat_age_s": round(heartbeat_age, 2),
+                "healthy": slot["ready"] > 0 and heartbeat_age < 3 * HEARTBEAT_INTERVAL,
+            })
+        healthy = self.running and len(workers) == self.args.workers and all(w["healthy"] for w in workers)
+        return healthy, {"pid": os.getpid(), "healthy": healthy, "workers": workers, "draining": sorted(self.draining)}
+
+    def _answer_health(self):
+        try:
+            conn, _ = self.health_sock.accept()
+        except BlockingIOError:
+            return
+        with conn:
+            conn.settimeout(1.0)
+            try:
+                conn.recv(4096)  # any request gets the report
+                healthy, report = self.health()
+                body = json.dumps(report).encode()
+                status = "200 OK" if healthy else "503 Service Unavailable"
+                conn.sendall(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+            except OSError:
+                pass
+
+def default_workers() -> int:
+    if config.SERVE_WORKERS:
+        return config.SERVE_WORKERS
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))  # the cores this process may run on, not all of the machine's
+    return os.cpu_count() or 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=f"{__package__}.main:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--max-requests", type=int, default=config.SERVE_MAX_REQUESTS, help="0 never recycles")
+    parser.add_argument("--max-requests-jitter", type=int, default=config.SERVE_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=int, default=config.SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--worker-timeout", type=float, default=config.SERVE_WORKER_TIMEOUT)
+    parser.add_argument("--health-port", type=int, default=config.SERVE_HEALTH_PORT, help="0 disables it")
+    parser.add_argument("--respawn-backoff", type=float, default=config.SERVE_RESPAWN_BACKOFF)
+    parser.add_argument("--respawn-backoff-max", type=float, default=config.SERVE_RESPAWN_BACKOFF_MAX)
+    parser.add_argument("--max-crashes", type=int, default=config.SERVE_MAX_CRASHES, help="0 never gives up")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+    return Arbiter(args).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Cold start profile of the Tut5 app: import time per module and time to first request.
+
+    python -m Tut5_APIRouting.startup_profile --output startup.json \
+        [--max-import-ms 1500 --max-first-response-ms 2500]
+
+Every measurement runs in a fresh interpreter, like a newly scaled-out worker. One
+runs under python -X importtime for the per-module breakdown. Two more import the app,
+run its lifespan startup and send a first request, timing each phase: the first boot
+against an empty database (the schema is created), the second against the same file
+(the schema version check only). With budgets given, the run exits with status 1 when
+the second boot exceeds one, so CI can gate on it. Set LAZY_ROUTERS=1 to profile lazy
+router loading.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE = __package__ or "Tut5_APIRouting"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child: prints the phase timings of one boot as JSON
+BOOT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+from {package}.main import app
+imported = time.perf_counter()
+import httpx
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get({path!r})
+        answered = time.perf_counter()
+    return started, answered, response.status_code
+
+started, answered, status = asyncio.run(boot())
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_request_ms": (answered - started) * 1000,
+    "first_response_ms": (answered - start) * 1000,
+    "status": status,
+}}))
+"""
+
+def _run(args, env):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+def import_times(env, top):
+    """The top modules by cumulative import time, from python -X importtime."""
+    stderr = _run(["-X", "importtime", "-c", f"import {PACKAGE}.main"], env).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": round(int(self_us) / 1000, 3),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 3),
+        })
+    app_modules = [m for m in modules if m["module"].startswith(f"{PACKAGE}.")]
+    modules.sort(key=lambda m: -m["cumulative_ms"])
+    return {
+        "top": modules[:top],
+        "app_self_ms": {m["module"]: m["self_ms"] for m in sorted(app_modules, key=lambda m: -m["self_ms"])},
+    }
+
+def boot(env, path):
+    start = time.perf_counter()
+    phases = json.loads(_run(["-c", BOOT.format(package=PACKAGE, path=path)], env).stdout.strip().splitlines()[-1])
+    phases["process_ms"] = (time.perf_counter() - start) * 1000  # interpreter startup included
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in phases.items()}
+
+def over_budget(warm, args):
+    budgets = {"import_ms": args.max_import_ms, "first_response_ms": args.max_first_response_ms}
+    return [
+        f"{name}: {warm[name]} ms > {budget} ms"
+        for name, budget in budgets.items() if budget is not None and warm[name] > budget
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/blogs/", help="first request to send")
+    parser.add_argument("--top", type=int, default=25, help="modules listed in the import breakdown")
+    parser.add_argument("--output", default="startup-profile.json")
+    parser.add_argument("--max-import-ms", type=float, help="budget for importing the app")
+    parser.add_argument("--max-first-response-ms", type=float, help="budget from import to first response")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'startup.db')}")
+        env.pop("ASYNC_DATABASE_URL", None)
+        report = {
+            "meta": {"lazy_routers": env.get("LAZY_ROUTERS", "0") == "1", "db_async": env.get("DB_ASYNC", "0") == "1"},
+            "first_boot": boot(env, args.path),
+            "warm_boot": boot(env, args.path),
+            "imports": import_times(env, args.top),
+        }
+    for name in ("first_boot", "warm_boot"):
+        print(f"{name:12} {report[name]}", file=sys.stderr)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}", file=sys.stderr)
+
+    problems = over_budget(report["warm_boot"], args)
+    for line in problems:
+        print(f"OVER BUDGET {line}", file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
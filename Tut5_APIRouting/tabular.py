@@ -0,0 +1,268 @@
+"""Streaming CSV / Parquet export and import of whole tables.
+
+Exports read a server-side cursor EXPORT_BATCH_ROWS rows at a time and hand every
+batch straight to the encoder, so memory stays at one batch whatever the table size.
+Parquet output writes one row group per batch and needs the optional pyarrow package.
+
+Imports parse the request body as it arrives: CSV record by record, Parquet (whose
+footer comes last) after spooling it to a temporary file, then one row group at a time.
+Rows are validated against a pydantic model and written IMPORT_BATCH_ROWS per
+transaction. Invalid rows are reported and skipped, like the bulk endpoints do.
+
+Both directions count rows, bytes and seconds in the transfer_* metrics and log their
+throughput on the Tut5_APIRouting.transfers logger. Imports also return it.
+"""
+import codecs
+import csv
+import io
+import logging
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import Select
+
+from web_common import metrics
+
+from . import compat, config
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, CSV only without it
+    pa = pq = None
+
+FORMATS = ("csv", "parquet")
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+transfer_log = logging.getLogger("Tut5_APIRouting.transfers")
+rows_total = metrics.register(metrics.Counter(
+    "transfer_rows_total", "Rows exported or imported", ("table", "direction", "format")
+))
+bytes_total = metrics.register(metrics.Counter(
+    "transfer_bytes_total", "Bytes sent by exports or received by imports", ("table", "direction", "format")
+))
+seconds_total = metrics.register(metrics.Counter(
+    "transfer_seconds_total", "Time spent in exports and imports", ("table", "direction", "format")
+))
+
+def _check_format(fmt: str):
+    if fmt == "parquet" and pa is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Parquet needs the pyarrow package")
+
+def _record(table: str, direction: str, fmt: str, rows: int, size: int, seconds: float):
+    labels = (table, direction, fmt)
+    rows_total.inc(*labels, amount=rows)
+    bytes_total.inc(*labels, amount=size)
+    seconds_total.inc(*labels, amount=seconds)
+    transfer_log.info(
+        "%s %s %s: %d rows, %d bytes in %.2fs (%.0f rows/s)",
+        table, direction, fmt, rows, size, seconds, rows / seconds if seconds else 0.0,
+    )
+
+# Export
+
+def _csv_chunks(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # an empty table still gets its header
+        yield buffer.getvalue().encode()
+
+class _ChunkSink:
+    """Write-only file the Parquet writer appends to, emptied after every row group."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+ARROW_TYPES = {int: "int64", float: "float64", str: "string", bool: "bool_"}
+
+def _parquet_chunks(columns, batches):
+    schema = pa.schema([(column.name, getattr(pa, ARROW_TYPES[column.type.python_type])()) for column in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in batches:
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def export_response(session_factory: Callable, stmt: Select, fmt: str, table: str) -> StreamingResponse:
+    """Streams every row of a statement selecting plain columns as CSV or Parquet. The
+    stream outlives the request's session, so it opens one of its own."""
+    _check_format(fmt)
+    columns = list(stmt.selected_columns)
+    counts = {"rows": 0, "bytes": 0}
+
+    def batches():
+        with session_factory() as db:
+            result = db.execute(stmt.execution_options(yield_per=config.EXPORT_BATCH_ROWS))
+            for rows in result.partitions():
+                counts["rows"] += len(rows)
+                yield rows
+
+    def generate():
+        start = time.perf_counter()
+        if fmt == "parquet":
+            chunks = _parquet_chunks(columns, batches())
+        else:
+            chunks = _csv_chunks([column.name for column in columns], batches())
+        for chunk in chunks:
+            counts["bytes"] += len(chunk)
+            yield chunk
+        _record(table, "export", fmt, counts["rows"], counts["bytes"], time.perf_counter() - start)
+
+    return StreamingResponse(
+        generate(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'},
+    )
+
+# Import
+
+def _complete_records(text: str) -> Tuple[List[str], str]:
+    """Splits text into whole CSV records and the incomplete rest. A line break inside a
+    quoted field does not end a record, so records are cut where the quotes balance."""
+    lines = text.split("\n")
+    records, current, quotes = [], [], 0
+    for line in lines[:-1]:
+        current.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            records.append("\n".join(current) + "\n")
+            current, quotes = [], 0
+    current.append(lines[-1])
+    return records, "\n".join(current)
+
+async def _csv_batches(request: Request, counts: dict):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header, pending, batch = None, "", []
+
+    def parse(records):
+        nonlocal header
+        try:
+            for row in csv.reader(records):
+                if header is None:
+                    header = row
+                elif row:
+                    batch.append(dict(zip(header, row)))
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+
+    async for chunk in request.stream():
+        counts["bytes"] += len(chunk)
+        try:
+            text = decoder.decode(chunk)
+        except UnicodeDecodeError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+        records, pending = _complete_records(pending + text)
+        parse(records)
+        while len(batch) >= config.IMPORT_BATCH_ROWS:
+            yield batch[:config.IMPORT_BATCH_ROWS]
+            del batch[:config.IMPORT_BATCH_ROWS]
+    try:
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {exc}")
+    if pending:
+        parse([pending])
+    if batch:
+        yield batch
+
+async def _parquet_batches(request: Request, counts: dict):
+    with tempfile.SpooledTemporaryFile(max_size=config.IMPORT_SPOOL_MAX_BYTES) as spool:
+        async for chunk in request.stream():
+            counts["bytes"] += len(chunk)
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            reader = pq.ParquetFile(spool)
+        except pa.ArrowException:
+            raise HTTPException(status_code=400, detail="Invalid Parquet file")
+        for record_batch in reader.iter_batches(batch_size=config.IMPORT_BATCH_ROWS):
+            yield record_batch.to_pylist()
+
+def _validate(model, row: dict, from_csv: bool):
+    if from_csv:  # CSV has no null, an empty cell of an optional field means None
+        row = {k: (None if v == "" and not compat.field_required(model, k) else v) for k, v in row.items()}
+    return compat.validate_dict(model, row)
+
+async def import_upload(
+    request: Request,
+    fmt: str,
+    table: str,
+    model: type,
+    insert_batch: Callable[[List[dict]], List[Tuple[int, str]]],
+) -> dict:
+    """Imports the rows of the request body. insert_batch gets the valid rows of a batch,
+    writes the ones it accepts in one transaction (it runs in the threadpool) and returns
+    (position in the batch, reason) for the ones it rejected."""
+    _check_format(fmt)
+    start = time.perf_counter()
+    counts = {"bytes": 0}
+    rows, error_count, errors, row_number = 0, 0, [], 0
+    batches = _parquet_batches(request, counts) if fmt == "parquet" else _csv_batches(request, counts)
+
+    def reject(number: int, detail: str):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < config.IMPORT_MAX_ERRORS:
+            errors.append({"index": number, "detail": detail})
+
+    async for batch in batches:
+        valid, numbers = [], []
+        for row in batch:
+            row_number += 1
+            try:
+                valid.append(_validate(model, row, fmt == "csv"))
+                numbers.append(row_number)
+            except ValidationError as exc:
+                first = exc.errors()[0]
+                reject(row_number, f"{'.'.join(map(str, first['loc']))}: {first['msg']}")
+        rejected = await run_in_threadpool(insert_batch, valid) if valid else []
+        for position, detail in rejected:
+            reject(numbers[position], detail)
+        rows += len(valid) - len(rejected)
+
+    seconds = time.perf_counter() - start
+    _record(table, "import", fmt, rows, counts["bytes"], seconds)
+    return {
+        "rows": rows,
+        "error_count": error_count,
+        "errors": errors,
+        "bytes": counts["bytes"],
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+    }
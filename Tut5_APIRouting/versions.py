@@ -0,0 +1,55 @@
+"""Row and collection versions for ETags (SQLite triggers).
+
+Every tracked table gets a <table>_versions side table, and a shared
+collection_versions table holds one counter per tracked table. Triggers bump the
+counter on every insert, update and delete, and stamp the written row with the new
+counter value, so every write path (single routes, bulk executemany, raw SQL)
+changes the version and a version is never reused, not even by a reused id.
+Looking a version up is a primary key read that never loads the row itself.
+"""
+from typing import Optional
+
+from sqlalchemy import text
+
+def _ddl(table: str):
+    bump = f"""
+        UPDATE collection_versions SET version = version + 1 WHERE name = '{table}';"""
+    stamp = f"""
+        INSERT OR REPLACE INTO {table}_versions(id, version)
+        SELECT new.id, version FROM collection_versions WHERE name = '{table}';"""
+    return [
+        "CREATE TABLE IF NOT EXISTS collection_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        f"CREATE TABLE IF NOT EXISTS {table}_versions (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_ai AFTER INSERT ON {table} BEGIN{bump}{stamp}\n    END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_au AFTER UPDATE ON {table} BEGIN{bump}{stamp}\n    END",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_version_ad AFTER DELETE ON {table} BEGIN{bump}
+        DELETE FROM {table}_versions WHERE id = old.id;
+    END""",
+    ]
+
+def ensure(connection, table: str):
+    """Installs version tracking for table, backfilling version 1 for its existing rows.
+    A no-op once installed, so it can run on every startup."""
+    installed = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table}_versions",)
+    ).scalar()
+    if installed:
+        return
+    for ddl in _ddl(table):
+        connection.exec_driver_sql(ddl)
+    connection.exec_driver_sql("INSERT OR IGNORE INTO collection_versions(name, version) VALUES (?, 1)", (table,))
+    connection.exec_driver_sql(f"INSERT OR IGNORE INTO {table}_versions(id, version) SELECT id, 1 FROM {table}")
+
+# Statements are shared by the sync helpers below and the async routers
+def row_version_stmt(table: str, row_id: int):
+    return text(f"SELECT version FROM {table}_versions WHERE id = :id").bindparams(id=row_id)
+
+def collection_version_stmt(table: str):
+    return text("SELECT version FROM collection_versions WHERE name = :name").bindparams(name=table)
+
+def row_version(db, table: str, row_id: int) -> Optional[int]:
+    """The row's version, None when the row does not exist."""
+    return db.execute(row_version_stmt(table, row_id)).scalar()
+
+def collection_version(db, table: str) -> int:
+    return db.execute(collection_version_stmt(table)).scalar()
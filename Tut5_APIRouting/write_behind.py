@@ -0,0 +1,198 @@
+"""Write-behind queue for blog creates and updates (WRITE_BEHIND=1).
+
+Every SQLite commit is an fsync, so committing each request on its own caps
+write throughput. In write-behind mode the routes validate the request, queue the
+mutation and answer 202 with a write id. A worker thread drains the queue and
+commits up to WRITE_BEHIND_BATCH_SIZE queued writes, or whatever arrived within
+WRITE_BEHIND_BATCH_MS, in a single transaction. When that transaction fails, the
+batch is retried a write per transaction so only the bad writes fail. Callers poll
+GET /blogs/writes/{write_id} for the outcome and, for creates, the new blog id.
+
+A full queue rejects new writes with a 503 and Retry-After, and the app lifespan
+calls flush() so queued writes are committed before the process exits.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import cache, config, database, models, queries
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class QueuedWrite:
+    __slots__ = ("write_id", "blog_id", "values")
+
+    def __init__(self, blog_id: Optional[int], values: dict):
+        self.write_id = uuid.uuid4().hex
+        self.blog_id = blog_id  # None for a create until it is committed
+        self.values = values
+
+class BlogWriteQueue:
+    def __init__(self, max_size: int, batch_size: int, batch_ms: float, status_entries: int):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.batch_seconds = batch_ms / 1000
+        self.status_entries = status_entries
+        self._queue = queue.Queue()
+        self._pending = 0  # submitted and not committed yet, queued or in the batch being built
+        self._statuses = OrderedDict()  # write_id -> status dict, oldest first
+        self._lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+        self._stats = {"queued": 0, "committed": 0, "failed": 0, "rejected": 0, "batches": 0}
+
+    def submit_create(self, values: dict) -> dict:
+        return self._submit(QueuedWrite(None, values))
+
+    def submit_update(self, blog_id: int, values: dict) -> dict:
+        return self._submit(QueuedWrite(blog_id, values))
+
+    def _submit(self, write: QueuedWrite) -> dict:
+        with self._lock:
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+            if self._closed or self._pending >= self.max_size:
+                self._stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many queued writes, try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._queue.put_nowait(write)
+            self._pending += 1
+            self._stats["queued"] += 1
+            return self._set_status(write, "queued")
+
+    def _set_status(self, write: QueuedWrite, state: str, detail: Optional[str] = None) -> dict:
+        # Called with self._lock held
+        entry = {"write_id": write.write_id, "status": state, "blog_id": write.blog_id, "detail": detail}
+        self._statuses[write.write_id] = entry
+        self._statuses.move_to_end(write.write_id)
+        while len(self._statuses) > self.status_entries:
+            self._statuses.popitem(last=False)
+        return entry
+
+    def status(self, write_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._statuses.get(write_id)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.batch_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    write = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if write is _STOP:
+                    stopping = True
+                    break
+                batch.append(write)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            failed = self._transaction(batch)
+        except SQLAlchemyError:
+            # One bad write (a constraint, a value SQLite rejects) must not fail the rest,
+            # so the batch is retried a write per transaction and only the bad ones fail
+            logger.exception("write-behind batch of %d writes failed, retrying them one by one", len(batch))
+            failed = {}
+            for write in batch:
+                try:
+                    failed.update(self._transaction([write]))
+                except SQLAlchemyError:
+                    logger.exception("write-behind write %s failed", write.write_id)
+                    failed[write.write_id] = "Write could not be committed"
+
+        with self._lock:
+            self._pending -= len(batch)
+            self._stats["batches"] += 1
+            self._stats["failed"] += len(failed)
+            self._stats["committed"] += len(batch) - len(failed)
+            for write in batch:
+                if write.write_id in failed:
+                    self._set_status(write, "failed", failed[write.write_id])
+                else:
+                    self._set_status(write, "committed")
+
+    def _transaction(self, writes) -> dict:
+        """Applies writes in one transaction, returns {write_id: detail} of the ones
+        that were skipped. Raises SQLAlchemyError with nothing applied."""
+        creates = [write for write in writes if write.blog_id is None]
+        updates = [write for write in writes if write.blog_id is not None]
+        failed = {}
+        try:
+            with database.SessionLocal() as db:
+                if creates:
+                    # The route checked the author on a read session, it may have been deleted
+                    # since. Checked again under the write lock, as SQLite does not enforce the FK
+                    known_authors = queries.existing(db, models.DBAuthor.id, (write.values["author_id"] for write in creates))
+                    for write in creates:
+                        if write.values["author_id"] not in known_authors:
+                            failed[write.write_id] = "Author not found"
+                    creates = [write for write in creates if write.write_id not in failed]
+                if creates:
+                    # Rowids are handed out in insertion order, as in the bulk create route
+                    ids = sorted(db.execute(
+                        insert(models.DBBlog).returning(models.DBBlog.id), [write.values for write in creates]
+                    ).scalars())
+                    for write, blog_id in zip(creates, ids):
+                        write.blog_id = blog_id
+                # Applied one by one, in queue order, so later updates of a blog win
+                for write in updates:
+                    stmt = update(models.DBBlog).where(models.DBBlog.id == write.blog_id).values(**write.values)
+                    if db.execute(stmt).rowcount == 0:
+                        failed[write.write_id] = "Blog not found"
+                db.commit()
+        except SQLAlchemyError:
+            for write in creates:
+                write.blog_id = None  # rolled back
+            raise
+        cache.invalidate_blog_versions(*(write.blog_id for write in updates))
+        return failed
+
+    def flush(self, timeout: Optional[float] = None):
+        """Commits every queued write and stops the worker, rejecting new writes meanwhile.
+        A later submit starts a new worker."""
+        with self._lock:
+            self._closed = True
+            worker = self._worker
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join(timeout)
+        with self._lock:
+            self._worker = None
+            self._closed = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "pending": self._pending}
+
+blog_writes = BlogWriteQueue(
+    config.WRITE_BEHIND_QUEUE_SIZE, config.WRITE_BEHIND_BATCH_SIZE,
+    config.WRITE_BEHIND_BATCH_MS, config.WRITE_BEHIND_STATUS_ENTRIES,
+)
+
+def accepted(write: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED, content=write,
+        headers={"Location": f"/blogs/writes/{write['write_id']}"},
+    )
@@ -0,0 +1,159 @@
+"""Jinja2Templates with compiled-template, page and fragment caches.
+
+- Templates are compiled once at startup by precompile(), and the bytecode is
+  kept on disk (FileSystemBytecodeCache), so a cold start loads it instead of
+  parsing and compiling the sources again.
+- page_response() caches whole rendered pages, keyed by template name and a hash
+  of the context without the request, for pages whose output depends on nothing else.
+- {% cache "name" %}...{% endcache %} caches a fragment such as the header or the
+  footer of a layout. Extra key parts are allowed, as in {% cache "nav", user.id %}.
+
+Both caches are LRU with a TTL. Their hits, misses and evictions come from stats(),
+and collect() gives them for every instance (or one app's) as {(app, cache, stat): value}.
+
+Shared by the fastapi_app* sites. It only needs FastAPI and Jinja2, so it imports
+nothing from Tut5_APIRouting and never touches a database. Settings come from the
+environment:
+
+    TEMPLATE_CACHE_MAX_ENTRIES   entries per page/fragment cache (512)
+    TEMPLATE_CACHE_TTL_SECONDS   seconds an entry is served (300)
+    TEMPLATE_AUTO_RELOAD         1 to pick up changed template files (0)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import jinja2
+from jinja2 import nodes
+from jinja2.ext import Extension
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "512"))
+TEMPLATE_CACHE_TTL_SECONDS = float(os.getenv("TEMPLATE_CACHE_TTL_SECONDS", "300"))
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+
+class RenderCache:
+    """LRU of rendered html that expires entries after ttl seconds. A miss renders
+    outside the lock, so a page may render a fragment through another RenderCache."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, html)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get_or_load(self, key: str, loader) -> str:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._data),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # The template name keeps equal keys in different templates apart
+        parts = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_cached", [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _cached(self, parts, caller):
+        fragments = self.environment.fragment_cache
+        if fragments is None:
+            return caller()
+        key = "fragment:" + ":".join(str(part) for part in parts)
+        # Stored as plain text, Markup keeps autoescape from escaping it a second time
+        return Markup(fragments.get_or_load(key, lambda: str(caller())))
+
+def _lru():
+    return RenderCache(TEMPLATE_CACHE_MAX_ENTRIES, TEMPLATE_CACHE_TTL_SECONDS)
+
+_instances = {}
+
+class CachedTemplates(Jinja2Templates):
+    def __init__(self, directory, name: str, bytecode_dir=None):
+        if bytecode_dir is not None:
+            Path(bytecode_dir).mkdir(parents=True, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(str(bytecode_dir))
+        else:
+            bytecode_cache = jinja2.FileSystemBytecodeCache()  # in a per-user temp directory
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(directory),
+            autoescape=True,
+            bytecode_cache=bytecode_cache,
+            auto_reload=TEMPLATE_AUTO_RELOAD,
+            extensions=[FragmentCacheExtension],
+        )
+        super().__init__(env=env)
+        self.pages = _lru()
+        env.fragment_cache = _lru()
+        _instances[name] = self
+
+    def precompile(self) -> int:
+        """Compiles every template, writing the bytecode cache on a first start."""
+        names = self.env.list_templates()
+        for template_name in names:
+            self.env.get_template(template_name)
+        return len(names)
+
+    def page_response(self, name: str, context: dict, **kwargs) -> HTMLResponse:
+        """TemplateResponse for a page whose output depends only on context minus the request."""
+        values = {key: value for key, value in context.items() if key != "request"}
+        digest = hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+        html = self.pages.get_or_load(f"page:{name}:{digest}", lambda: self.get_template(name).render(context))
+        return HTMLResponse(html, **kwargs)
+
+    def stats(self) -> dict:
+        return {"pages": self.pages.stats(), "fragments": self.env.fragment_cache.stats()}
+
+def collect(app: Optional[str] = None) -> dict:
+    """Counters of every CachedTemplates, or of app's only, e.g. for a
+    template_cache{app, cache, stat} gauge."""
+    return {
+        (name, cache_name, stat): value
+        for name, templates in _instances.items() if app is None or name == app
+        for cache_name, stats in templates.stats().items()
+        for stat, value in stats.items()
+        if isinstance(value, (int, float))
+    }
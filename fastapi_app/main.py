@@ -1,20 +1,50 @@
+from pathlib import Path
+
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from web_common import compression, metrics
+from web_common.static_assets import PrecompressedStaticFiles, load_manifest, static_url_builder
+import cached_templates
+from cached_templates import CachedTemplates
 
 app=FastAPI()
+# run from the repository root
+# uvicorn fastapi_app.main:app --reload
 # <a href="{{ url_for('read_item', id=id) }} in base.html can also be used
 
+BASE_DIR = Path(__file__).parent
+# static_dist is the output of: python -m web_common.static_assets fastapi_app/static fastapi_app/static_dist
+# it adds fingerprinted names and .gz/.br siblings, without it static/ is served as is
+STATIC_DIR = BASE_DIR / "static_dist" if load_manifest(BASE_DIR / "static_dist") else BASE_DIR / "static"
+
 # Set up templates and static file directories
-templates=Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Compiled once here, with the bytecode kept in .jinja_cache for the next start
+templates=CachedTemplates(BASE_DIR / "templates", "fastapi_app", bytecode_dir=BASE_DIR / ".jinja_cache")
+templates.env.globals["static_url"] = static_url_builder("/static", STATIC_DIR)
+templates.precompile()
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
+# gzip/brotli for the rendered pages, precompressed static files pass through untouched
+compression.install(app)
+# Request latency and the template cache hit/miss/eviction counters on /metrics,
+# from a registry of this app's own
+registry = metrics.Registry()
+metrics.install(app, registry=registry)
+registry.register(metrics.Gauge(
+    "template_cache", "Template page and fragment cache counters",
+    lambda: cached_templates.collect("fastapi_app"), ("app", "cache", "stat")
+))
 
+# Both pages render the same html every time, so they come from the page cache
 @app.get('/',response_class=HTMLResponse)
 def read_root(request:Request):
-    return templates.TemplateResponse("index.html", {"request": request, "title": "Home Page", "message": "Welcome to FastAPI with Templates!"})
+    return templates.page_response("index.html", {"request": request, "title": "Home Page", "message": "Welcome to FastAPI with Templates!"})
 
 @app.get("/about", response_class=HTMLResponse)
 def about_page(request: Request):
     # Render the base.html template with custom content
-    return templates.TemplateResponse("base.html", {"request": request, "title": "About Us", "content": "This is the about page of our FastAPI app."})
+    return templates.page_response("base.html", {"request": request, "title": "About Us", "content": "This is the about page of our FastAPI app."})
+
+# Page and fragment cache counters
+@app.get("/stats/templates", tags=["Stats"])
+def template_stats():
+    return templates.stats()
@@ -1,19 +1,36 @@
+from pathlib import Path
+
 from fastapi import FastAPI, Form, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from web_common import metrics
+import cached_templates
+from cached_templates import CachedTemplates
 
 app = FastAPI()
+# run from the repository root
+# uvicorn fastapi_app2.main:app --reload
+
+BASE_DIR = Path(__file__).parent
 
-# Setting up templates
-templates = Jinja2Templates(directory="templates")
+# Setting up templates, compiled once here with the bytecode kept in .jinja_cache for the next start
+templates = CachedTemplates(BASE_DIR / "templates", "fastapi_app2", bytecode_dir=BASE_DIR / ".jinja_cache")
+templates.precompile()
+# Request latency and the template cache hit/miss/eviction counters on /metrics,
+# from a registry of this app's own
+registry = metrics.Registry()
+metrics.install(app, registry=registry)
+registry.register(metrics.Gauge(
+    "template_cache", "Template page and fragment cache counters",
+    lambda: cached_templates.collect("fastapi_app2"), ("app", "cache", "stat")
+))
 
 @app.get("/", response_class=HTMLResponse)
 async def show_form(request: Request):
     """
-    Display the input form to the user.
+    Display the input form to the user, the same html every time, so from the page cache.
     """
-    return templates.TemplateResponse("form.html", {"request": request})
+    return templates.page_response("form.html", {"request": request})
 
 @app.post("/submit", response_class=HTMLResponse)
 async def process_form(request: Request, name: str = Form(...), age: int = Form(...)):
@@ -22,3 +39,10 @@ async def process_form(request: Request, name: str = Form(...), age: int = Form(
     """
     message = f"Hello, {name}! You are {age} years old."
     return templates.TemplateResponse("result.html", {"request": request, "message": message})
+
+@app.get("/stats/templates", tags=["Stats"])
+async def template_stats():
+    """
+    Page and fragment cache counters.
+    """
+    return templates.stats()
@@ -0,0 +1,5 @@
+"""ASGI middleware and metrics shared by every app in the repository.
+
+Nothing here imports Tut5_APIRouting, so the template sites and the tutorial apps
+can use it without loading the Tut5 config, models or database.
+"""
@@ -0,0 +1,171 @@
+"""Negotiated gzip / brotli response compression.
+
+CompressionMiddleware is pure ASGI, like metrics.MetricsMiddleware, so streamed
+responses (the NDJSON exports) are compressed chunk by chunk and flushed as they
+go instead of being buffered. Only responses whose content type is in the
+allowlist and whose body reaches the size threshold are compressed, and responses
+that already carry a Content-Encoding (precompressed static files) pass through.
+brotli is used when the optional brotli package is installed and the client
+prefers it, gzip otherwise. Defaults come from the environment:
+
+    COMPRESSION_MIN_SIZE         smaller bodies are sent as they are (1024 bytes)
+    COMPRESSION_TYPES            comma separated content types to compress
+    COMPRESSION_GZIP_LEVEL       zlib level (6)
+    COMPRESSION_BROTLI_QUALITY   brotli quality (4)
+"""
+import os
+import zlib
+from typing import Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+SUPPORTED = ("br", "gzip") if brotli is not None else ("gzip",)
+
+def accepted_encodings(accept_encoding: str, available: Iterable[str] = SUPPORTED) -> List[str]:
+    """The available encodings the client accepts, best first. Ties keep the order of
+    available, so brotli wins over gzip at equal q."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    ranked = []
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > 0:
+            ranked.append((q, encoding))
+    ranked.sort(key=lambda pair: -pair[0])  # stable, so ties keep the order of available
+    return [encoding for _, encoding in ranked]
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.process(data) + (self._compressor.finish() if final else self._compressor.flush())
+
+def _add_vary(headers: MutableHeaders):
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_TYPES = os.getenv(
+    "COMPRESSION_TYPES",
+    "application/json,application/x-ndjson,text/html,text/css,text/plain,text/csv,"
+    "application/javascript,text/javascript,image/svg+xml,application/xml",
+).split(",")
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        content_types: Iterable[str] = COMPRESSION_TYPES,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = frozenset(content_types)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    def _compressible(self, status: int, headers: MutableHeaders) -> bool:
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").split(";")[0].strip().lower() in self.content_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding: Optional[str] = accepted[0] if accepted else None
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether it is worth compressing
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend or a trailer: there is no body to compress,
+                # so the held start goes out as it is, ahead of the message
+                if start is not None and encoder is None:
+                    passthrough = True
+                    await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start["headers"])
+                compressible = self._compressible(start["status"], headers)
+                if compressible:
+                    _add_vary(headers)  # caches must key on Accept-Encoding even for identity
+                length = headers.get("content-length")
+                too_small = (len(body) if not more_body else int(length or self.minimum_size)) < self.minimum_size
+                if not compressible or encoding is None or too_small:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = self._encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                # The compressed bytes differ from the identity ones, so a strong ETag becomes weak,
+                # http_cache.is_fresh compares weakly and still answers 304 for it
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                del headers["content-length"]
+                if not more_body:
+                    body = encoder.encode(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            await send({"type": "http.response.body", "body": encoder.encode(body, final=not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+def install(app):
+    app.add_middleware(CompressionMiddleware)
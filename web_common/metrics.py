@@ -0,0 +1,230 @@
+"""Request-level performance metrics in the Prometheus text format.
+
+install(app, *engines) adds the timing middleware, hooks SQL timing onto the
+engines and serves everything on GET /metrics. Per request it records latency,
+the number of SQL statements and the time spent in them and in password
+hashing, labelled by route template, so the rest of the latency (validation,
+serialization) is whatever those don't account for.
+
+An app serves the metrics of one Registry. The database apps share the default
+REGISTRY, which also holds the SQL, hashing, rate limit and transfer metrics
+registered at import. An app that wants only its own passes registry=Registry().
+Statements slower than SLOW_QUERY_MS (env, 100) are logged on the web_common.sql logger.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+slow_query_log = logging.getLogger("web_common.sql")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for label_values, value in self._values.items():
+                yield f"{self.name}{_labels(self.label_names, label_values)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.label_names + ("le",)
+        with self._lock:
+            for label_values, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    yield f"{self.name}_bucket{_labels(names, label_values + (bound,))} {cumulative}"
+                yield f"{self.name}_bucket{_labels(names, label_values + ('+Inf',))} {count}"
+                yield f"{self.name}_sum{_labels(self.label_names, label_values)} {total}"
+                yield f"{self.name}_count{_labels(self.label_names, label_values)} {count}"
+
+class Gauge:
+    """Read from a callback returning {label values: value} at scrape time."""
+
+    def __init__(self, name: str, help: str, collect, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for label_values, value in self.collect().items():
+            yield f"{self.name}{_labels(self.label_names, label_values)} {value}"
+
+ROUTE_LABELS = ("method", "route")
+
+class RequestMetrics:
+    """The per-route series MetricsMiddleware records, one set per registry."""
+
+    def __init__(self, registry: "Registry"):
+        self.requests_total = registry.register(Counter("http_requests_total", "Requests served", ROUTE_LABELS + ("status",)))
+        self.request_seconds = registry.register(Histogram("http_request_duration_seconds", "Request latency", labels=ROUTE_LABELS))
+        self.request_sql_statements = registry.register(Histogram(
+            "http_request_sql_statements", "SQL statements executed per request", COUNT_BUCKETS, ROUTE_LABELS
+        ))
+        self.request_sql_seconds = registry.register(Histogram(
+            "http_request_sql_seconds", "Time spent in SQL per request", labels=ROUTE_LABELS
+        ))
+        self.request_hashing_seconds = registry.register(Histogram(
+            "http_request_hashing_seconds", "Time spent hashing passwords per request", labels=ROUTE_LABELS
+        ))
+
+class Registry:
+    """The metrics one /metrics endpoint renders."""
+
+    def __init__(self):
+        self.metrics = []
+        self._requests = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def requests(self) -> RequestMetrics:
+        # Created on the first install, apps installed on the same registry share one set
+        if self._requests is None:
+            self._requests = RequestMetrics(self)
+        return self._requests
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+def register(metric):
+    return REGISTRY.register(metric)
+
+def render() -> str:
+    return REGISTRY.render()
+
+sql_seconds = register(Histogram("sql_statement_duration_seconds", "Duration of single SQL statements"))
+slow_queries_total = register(Counter("sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS"))
+hashing_seconds = register(Histogram("hashing_duration_seconds", "bcrypt time per operation", labels=("operation",)))
+
+class RequestStats:
+    __slots__ = ("sql_statements", "sql_seconds", "hashing_seconds")
+
+    def __init__(self):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.hashing_seconds = 0.0
+
+# Stats of the request being served. Sync routes run in the threadpool with a copy of
+# the context, which still points at the same RequestStats object.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+def record_hashing(operation: str, seconds: float):
+    hashing_seconds.observe(seconds, operation)
+    stats = current_request.get()
+    if stats is not None:
+        stats.hashing_seconds += seconds
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        sql_seconds.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_statements += 1
+            stats.sql_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_queries_total.inc()
+            slow_query_log.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed until their last chunk."""
+
+    def __init__(self, app, registry: Registry = REGISTRY):
+        self.app = app
+        self.requests = registry.requests()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            # The router stores the matched route in the scope, its path is the template
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            requests = self.requests
+            requests.requests_total.inc(*labels, status_code)
+            requests.request_seconds.observe(elapsed, *labels)
+            requests.request_sql_statements.observe(stats.sql_statements, *labels)
+            requests.request_sql_seconds.observe(stats.sql_seconds, *labels)
+            requests.request_hashing_seconds.observe(stats.hashing_seconds, *labels)
+
+def install(app: FastAPI, *engines, registry: Registry = REGISTRY):
+    for engine in engines:
+        instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def metrics_endpoint():
+        return registry.render()
@@ -0,0 +1,122 @@
+"""Fingerprinted, precompressed static files.
+
+Build step, run after changing anything in the source directory:
+
+    python -m web_common.static_assets fastapi_app/static fastapi_app/static_dist
+
+It copies every file to the output directory twice, under its own name and under a
+fingerprinted one (style.css -> style.<sha256 prefix>.css), writes .gz and, with
+the optional brotli package, .br siblings for text assets, and records the
+fingerprinted names in manifest.json. Templates link through static_url(), which
+resolves names through the manifest, so a changed file gets a new URL and the
+fingerprinted ones can be cached for a year as immutable.
+
+PrecompressedStaticFiles serves the .br or .gz sibling the client accepts, so hot
+assets are never compressed per request.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import stat
+import sys
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+from .compression import accepted_encodings, brotli
+
+MANIFEST = "manifest.json"
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE = {".css", ".js", ".mjs", ".html", ".svg", ".json", ".txt", ".map", ".xml"}
+FINGERPRINT = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+class PrecompressedStaticFiles(StaticFiles):
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if isinstance(response, FileResponse) and Path(path).suffix in COMPRESSIBLE:
+            accept = Headers(scope=scope).get("accept-encoding", "")
+            for encoding in accepted_encodings(accept, tuple(SUFFIXES)):
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + SUFFIXES[encoding])
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    content_type = response.headers["content-type"]
+                    # Its own ETag and Last-Modified, so conditional requests are answered per encoding
+                    response = self.file_response(full_path, stat_result, scope)
+                    response.headers["Content-Encoding"] = encoding
+                    if isinstance(response, FileResponse):
+                        response.headers["Content-Type"] = content_type
+                    break
+            response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = IMMUTABLE if FINGERPRINT.search(path) else "no-cache"
+        return response
+
+def load_manifest(directory) -> dict:
+    try:
+        with open(Path(directory) / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def static_url_builder(prefix: str, directory):
+    """static_url("style.css") -> "/static/style.<hash>.css", or the plain name without a manifest."""
+    manifest = load_manifest(directory)
+
+    def static_url(name: str) -> str:
+        return f"{prefix}/{manifest.get(name, name)}"
+
+    return static_url
+
+def fingerprinted_name(relative: Path, data: bytes) -> Path:
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return relative.with_name(f"{relative.stem}.{digest}{relative.suffix}")
+
+def write_with_siblings(target: Path, data: bytes) -> int:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    written = 1
+    if target.suffix not in COMPRESSIBLE:
+        return written
+    # mtime=0 keeps the .gz byte for byte reproducible between builds
+    siblings = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        siblings[".br"] = brotli.compress(data, quality=11)
+    for suffix, compressed in siblings.items():
+        if len(compressed) < len(data):
+            Path(f"{target}{suffix}").write_bytes(compressed)
+            written += 1
+    return written
+
+def build(source: Path, output: Path) -> dict:
+    if output.resolve() == source.resolve():
+        raise SystemExit("the output directory must differ from the source directory")
+    if output.exists():
+        if not (output / MANIFEST).exists() and any(output.iterdir()):
+            raise SystemExit(f"{output} is not empty and was not built by this command, not touching it")
+        shutil.rmtree(output)
+    manifest, written = {}, 0
+    for path in sorted(p for p in source.rglob("*") if p.is_file()):
+        relative = path.relative_to(source)
+        data = path.read_bytes()
+        hashed = fingerprinted_name(relative, data)
+        written += write_with_siblings(output / relative, data)
+        written += write_with_siblings(output / hashed, data)
+        manifest[relative.as_posix()] = hashed.as_posix()
+    output.mkdir(parents=True, exist_ok=True)
+    (output / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    print(f"{len(manifest)} assets, {written} files written to {output}", file=sys.stderr)
+    if brotli is None:
+        print("brotli is not installed, only .gz siblings were written", file=sys.stderr)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress a static directory")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("output", type=Path)
+    args = parser.parse_args()
+    build(args.source, args.output)